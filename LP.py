@@ -1,8 +1,14 @@
+import logging
 import pandas as pd
-import pulp as p
 import time
 
-import constants as c
+from arbitrage import is_storage_only, solve_arbitrage
+from backends import get_backend
+from battery import BatteryParams
+from matrix_model import attach_solution, build_model, time_step
+from stats import SolveStats
+
+logger = logging.getLogger(__name__)
 
 
 def solve_model(
@@ -13,93 +19,145 @@ def solve_model(
     energy_cap: int,
     grid_cap: int,
     start_charge: int,
+    backend="highs",
+    engine="auto",
+    hooks=(),
+    return_stats=False,
+    params=None,
+    dt=None,
 ):
+    # engine is "lp", "arbitrage" (storage-only cases, see arbitrage.py),
+    # "decomposed" (monthly blocks solved in parallel, see decomposition.py)
+    # or "auto" to use the arbitrage engine whenever it applies. Each hook is
+    # called as hook(phase, seconds, stats) as the phases finish, and
+    # return_stats=True adds the SolveStats to the returned tuple. params
+    # is a battery.BatteryParams (constants.py values when None). dt is the
+    # length of a row in hours, by default df.attrs["dt"] or 1. The results
+    # are added to a copy of df, which is returned.
+    if engine not in ("auto", "lp", "arbitrage", "decomposed"):
+        raise ValueError(f"Unknown engine '{engine}'")
 
     start = time.time()
-
-    df["Solar"] = df["Solar"]
-    df["Wind"] = df["Wind"]
-
-    T = df.shape[0]
-    model = p.LpProblem("Model", p.LpMaximize)
-    print("model created!")
-
-    # Initialise arrays to hold variables for each time step
-    solar = [None] * T
-    wind = [None] * T
-    charge = [None] * T
-    discharge = [None] * T
-    grid_export = [None] * T
-    grid_import = [None] * T
-    soc = [None] * T
-    objective = [None] * T
-
-    # Create varliables ∀ t in T
-    for t in range(T):
-        solar[t] = p.LpVariable(f"solar_{t}", lowBound=0, upBound=solar_cap)
-        wind[t] = p.LpVariable(f"wind_{t}", lowBound=0, upBound=wind_cap)
-
-        charge[t] = p.LpVariable(
-            f"charge_{t}", lowBound=0, upBound=battery_cap
-        )
-        discharge[t] = p.LpVariable(
-            f"discharge_{t}", lowBound=0, upBound=battery_cap
+    stats = SolveStats(hooks)
+    params = BatteryParams() if params is None else params
+    dt = time_step(df, dt)
+    df = df.copy()
+
+    if engine == "arbitrage" or (
+        engine == "auto" and is_storage_only(df, solar_cap, wind_cap, params)
+    ):
+        if not is_storage_only(df, solar_cap, wind_cap, params):
+            raise ValueError(
+                "The arbitrage engine needs no solar or wind, non-negative "
+                "prices and no self-discharge, terminal SOC, cycle limit or "
+                "depth-of-discharge cost"
+            )
+        df, revenue, _ = solve_arbitrage(
+            df,
+            battery_cap,
+            energy_cap,
+            grid_cap,
+            start_charge,
+            stats,
+            params,
+            dt,
         )
-        grid_export[t] = p.LpVariable(
-            f"grid_export_{t}", lowBound=0, upBound=grid_cap
+    elif engine == "decomposed":
+        from decomposition import solve_decomposed
+
+        df, revenue, _ = solve_decomposed(
+            df,
+            solar_cap,
+            wind_cap,
+            battery_cap,
+            energy_cap,
+            grid_cap,
+            start_charge,
+            backend=backend,
+            stats=stats,
+            params=params,
+            dt=dt,
         )
-        grid_import[t] = p.LpVariable(
-            f"grid_import_{t}", lowBound=0, upBound=grid_cap
+    else:
+        model = build_model(
+            df,
+            solar_cap,
+            wind_cap,
+            battery_cap,
+            energy_cap,
+            grid_cap,
+            start_charge,
+            stats,
+            params,
+            dt,
         )
-        soc[t] = p.LpVariable(f"soc_{t}", lowBound=0, upBound=energy_cap)
 
-    # Create Objective function and constraints ∀ t in T
-    for t in range(T):
-        objective[t] = (grid_export[t] - grid_import[t]) * df.Price[t]
-        model += (solar[t] + wind[t] + discharge[t] - charge[t]) == (
-            grid_export[t] * (1 / c.INVERTER_EFF)
-            - grid_import[t] * c.INVERTER_EFF
+        solver = get_backend(backend)
+        with stats.phase("solve"):
+            solution = solver.solve(model)
+        stats.count(
+            engine="lp",
+            backend=solver.name,
+            status=solution.status,
+            iterations=solution.iterations,
         )
-        model += solar[t] <= df.Solar[t]
-        model += wind[t] <= df.Wind[t]
-        if t == 0:
-            model += soc[t] == (
-                start_charge
-                + (
-                    charge[t] * c.BATTERY_EFF
-                    - discharge[t] * (1 / c.BATTERY_EFF)
-                )
-            )
-        else:
-            model += soc[t] == (
-                soc[t - 1]
-                + (
-                    charge[t] * c.BATTERY_EFF
-                    - discharge[t] * (1 / c.BATTERY_EFF)
-                )
+        logger.info("LP Status = %s", solution.status)
+        if solution.x is None:
+            raise RuntimeError(f"LP could not be solved: {solution.status}")
+
+        with stats.phase("extraction"):
+            revenue = attach_solution(df, model, solution)
+        discharge = model.unpack(solution.x)["discharge"]
+        stats.count(
+            equivalent_cycles=params.equivalent_cycles(
+                discharge, energy_cap, dt
             )
+        )
 
-    model += sum(objective)
-
-    print("LP Solving:")
-    status = model.solve()
-    print(f"LP Status = {status}")
-
-    ans_soc = [None] * T
-    ans_objective = [None] * T
-    ans_IMP = [None] * T
-    ans_EXP = [None] * T
-
-    for t in range(T):
-        ans_soc[t] = p.value(soc[t])
-        ans_objective[t] = p.value(objective[t])
-        ans_IMP[t] = p.value(grid_import[t])
-        ans_EXP[t] = p.value(grid_export[t])
-
-    df["SOC"] = ans_soc
-    df["IMP"] = ans_IMP
-    df["EXP"] = ans_EXP
+    # revenue is net of any degradation cost
+    gross = dt * float(df["Price"] @ (df["EXP"] - df["IMP"]))
+    stats.count(gross_revenue=gross, degradation_cost=float(gross - revenue))
 
     end = time.time()
     solve_time = end - start
-    return (df, sum(ans_objective), solve_time)
+    if return_stats:
+        return (df, revenue, solve_time, stats)
+    return (df, revenue, solve_time)
+
+
+def compare_backends(
+    df: pd.DataFrame,
+    solar_cap: int,
+    wind_cap: int,
+    battery_cap: int,
+    energy_cap: int,
+    grid_cap: int,
+    start_charge: int,
+    backends=("highs", "cbc"),
+):
+    # Solve the same model with each backend, for benchmarking them
+    model = build_model(
+        df,
+        solar_cap,
+        wind_cap,
+        battery_cap,
+        energy_cap,
+        grid_cap,
+        start_charge,
+    )
+
+    rows = []
+    for name in backends:
+        solution = get_backend(name).solve(model)
+        rows.append(
+            {
+                "backend": name,
+                "status": solution.status,
+                "revenue": (
+                    None if solution.objective is None else -solution.objective
+                ),
+                "solve_time": solution.time,
+                "iterations": solution.iterations,
+            }
+        )
+    return pd.DataFrame(rows)
@@ -0,0 +1,196 @@
+from bisect import bisect_left, bisect_right
+
+import numpy as np
+import pandas as pd
+import time
+
+from battery import BatteryParams
+from matrix_model import time_step
+from stats import SolveStats
+
+# Storage-only arbitrage (no solar or wind) solved without an LP solver.
+#
+# With solar and wind at zero the LP of LP.solve_model only decides how the
+# SOC moves each step (of dt hours). Changing the SOC by d earns r_t(d),
+# which is -price * d / (charge_eff * inverter_eff) when charging and
+# (-price * discharge_eff * inverter_eff + throughput_cost) * d when
+# discharging, within the charge/discharge limits set by battery_cap and
+# grid_cap. For non-negative
+# prices r_t is concave, so the best revenue as a function of the SOC after
+# step t, V_t, is concave and piecewise linear and
+#   V_t(s) = max_u V_{t-1}(u) + r_t(s - u),  soc_min <= s <= soc_max
+# is found by merging the sorted slopes of V_{t-1} and r_t. This is exact,
+# not a discretisation, and only three numbers per step are needed to walk
+# back through the optimal SOC path. The revenue per MWh moved does not
+# depend on the step length; only the charge/discharge limits do.
+
+
+def is_storage_only(
+    df: pd.DataFrame, solar_cap: int, wind_cap: int, params=None
+):
+    # Whether the fast engine solves this case exactly. Self-discharge,
+    # terminal SOC targets, cycle limits and depth-of-discharge costs need
+    # the LP.
+    no_solar = solar_cap == 0 or not df["Solar"].any()
+    no_wind = wind_cap == 0 or not df["Wind"].any()
+    simple = params is None or params.is_simple
+    return no_solar and no_wind and simple and bool((df["Price"] >= 0).all())
+
+
+def dispatch(
+    price,
+    battery_cap,
+    energy_cap,
+    grid_cap,
+    start_charge,
+    params=None,
+    dt=1.0,
+):
+    # Optimal SOC path for the given prices (one per step of dt hours),
+    # returned with the revenue. Only the efficiencies, SOC range and
+    # throughput cost of params are used.
+    params = BatteryParams() if params is None else params
+    k_charge = 1 / (params.charge_eff * params.inverter_eff)
+    k_discharge = params.discharge_eff * params.inverter_eff
+    # Largest SOC rise and fall in one step
+    up = (
+        dt
+        * params.charge_eff
+        * min(battery_cap, grid_cap * params.inverter_eff)
+    )
+    down = (
+        dt
+        * min(battery_cap, grid_cap / params.inverter_eff)
+        / params.discharge_eff
+    )
+    soc_min = params.soc_min * energy_cap
+    soc_max = params.soc_max * energy_cap
+
+    T = len(price)
+    prev_lo = np.empty(T)
+    before_down = np.empty(T)
+    between = np.empty(T)
+
+    # V is stored as its value at the lowest feasible SOC `lo` plus
+    # segments of decreasing slope; `keys` holds the negated slopes so the
+    # lists stay sorted for bisect
+    keys, lengths = [], []
+    lo, value, total = float(start_charge), 0.0, 0.0
+    for t in range(T):
+        s_down = -price[t] * k_discharge + params.throughput_cost
+        s_up = -price[t] * k_charge
+        i_down = bisect_left(keys, -s_down)
+        i_up = bisect_left(keys, -s_up)
+        prev_lo[t] = lo
+        before_down[t] = sum(lengths[:i_down])
+        between[t] = sum(lengths[i_down:i_up])
+
+        # Convolve with r_t: start from the full discharge, then add the
+        # discharge and charge segments in slope order
+        lo -= down
+        value -= s_down * down
+        for key, length in ((-s_up, up), (-s_down, down)):
+            if length > 0:
+                i = bisect_right(keys, key)
+                keys.insert(i, key)
+                lengths.insert(i, length)
+        total += up + down
+
+        # Clip the domain to [soc_min, soc_max]
+        while lo < soc_min and lengths:
+            cut = min(soc_min - lo, lengths[0])
+            value -= keys[0] * cut
+            lo += cut
+            total -= cut
+            if cut == lengths[0]:
+                del keys[0], lengths[0]
+            else:
+                lengths[0] -= cut
+        excess = lo + total - soc_max
+        while excess > 0 and lengths:
+            cut = min(excess, lengths[-1])
+            excess -= cut
+            total -= cut
+            if cut == lengths[-1]:
+                del keys[-1], lengths[-1]
+            else:
+                lengths[-1] -= cut
+
+    # The SOC left at the end is worth nothing, so stop at the last
+    # positive slope of V_T
+    soc = np.empty(T)
+    s = lo
+    for key, length in zip(keys, lengths):
+        if key >= 0:
+            break
+        value -= key * length
+        s += length
+    revenue = value
+
+    # Walk back: the distance of s into the merged segments of step t
+    # splits into the part taken from V_{t-1} and the part taken from r_t
+    for t in range(T - 1, -1, -1):
+        soc[t] = s
+        x = s - (prev_lo[t] - down)
+        taken = min(max(x - before_down[t], 0), down) + min(
+            max(x - before_down[t] - down - between[t], 0), up
+        )
+        s = s - (taken - down)
+
+    return soc, revenue
+
+
+def solve_arbitrage(
+    df: pd.DataFrame,
+    battery_cap: int,
+    energy_cap: int,
+    grid_cap: int,
+    start_charge: int,
+    stats=None,
+    params=None,
+    dt=None,
+):
+    # Same results as LP.solve_model with no solar or wind
+    start = time.time()
+    stats = SolveStats() if stats is None else stats
+    params = BatteryParams() if params is None else params
+    dt = time_step(df, dt)
+    if not params.is_simple:
+        raise ValueError(
+            "Storage-only dispatch does not model self-discharge, terminal "
+            "SOC, cycle limits or depth-of-discharge costs"
+        )
+
+    with stats.phase("data_prep"):
+        price = df["Price"].to_numpy(dtype=float)
+        if (price < 0).any():
+            raise ValueError("Storage-only dispatch needs non-negative prices")
+
+    with stats.phase("solve"):
+        soc, revenue = dispatch(
+            price,
+            battery_cap,
+            energy_cap,
+            grid_cap,
+            start_charge,
+            params,
+            dt,
+        )
+    stats.count(engine="arbitrage", status="Optimal")
+
+    with stats.phase("extraction"):
+        # SOC changes (MWh) back to power (MW)
+        delta = np.diff(soc, prepend=start_charge) / dt
+        charge = np.maximum(delta, 0) / params.charge_eff
+        discharge = np.maximum(-delta, 0) * params.discharge_eff
+
+        df["SOC"] = soc
+        df["IMP"] = charge / params.inverter_eff
+        df["EXP"] = discharge * params.inverter_eff
+    stats.count(
+        equivalent_cycles=params.equivalent_cycles(discharge, energy_cap, dt)
+    )
+
+    end = time.time()
+    solve_time = end - start
+    return (df, revenue, solve_time)
@@ -0,0 +1,285 @@
+# Built models saved to disk, so that an expensive build (e.g. a year with
+# cycle limits and depth-of-discharge segments) is done once, shared between
+# workers and machines, and replayed against any backend to study solver
+# performance without rebuilding. A model is one compressed .npz holding
+# the objective, bounds and right-hand sides, the CSR parts of A_eq (and
+# A_ub) and a JSON header with its shape and what it was built from. From a
+# terminal:
+#   python artifacts.py build 8760_data.csv year.npz --battery 10 --energy 40
+#   python artifacts.py solve year.npz --backend highspy
+#   python artifacts.py mps year.npz year.mps
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+
+from battery import BatteryParams
+from matrix_model import MatrixModel, build_model, time_step
+
+# Bumped whenever the layout of the file changes
+FORMAT = 1
+
+ARRAYS = ("c", "b_eq", "lb", "ub", "b_ub")
+MATRICES = ("A_eq", "A_ub")
+
+
+def save_model(model: MatrixModel, path, metadata=None):
+    # Write model to path (.npz) with metadata (anything JSON can hold) and
+    # return the path
+    header = {
+        "format": FORMAT,
+        "T": model.T,
+        "segments": model.segments,
+        "dt": model.dt,
+        "metadata": metadata or {},
+    }
+    arrays = {"header": np.array(json.dumps(header))}
+    for name in ARRAYS:
+        values = getattr(model, name)
+        if values is not None:
+            arrays[name] = np.asarray(values, dtype=np.float64)
+    for name in MATRICES:
+        A = getattr(model, name)
+        if A is not None:
+            A = sp.csr_matrix(A)
+            arrays[f"{name}_data"] = A.data
+            arrays[f"{name}_indices"] = A.indices
+            arrays[f"{name}_indptr"] = A.indptr
+            arrays[f"{name}_shape"] = np.array(A.shape)
+
+    # Written under another name first, so readers never see half a file
+    tmp = path + ".tmp.npz"
+    np.savez_compressed(tmp, **arrays)
+    os.replace(tmp, path)
+    return path
+
+
+def load_model(path):
+    # The MatrixModel saved at path, ready for any backend's solve(), and
+    # the metadata it was saved with
+    with np.load(path) as data:
+        header = json.loads(str(data["header"]))
+        if header["format"] != FORMAT:
+            raise ValueError(
+                f"{path} has model format {header['format']}, not {FORMAT}"
+            )
+        arrays = {name: data[name] for name in ARRAYS if name in data.files}
+        for name in MATRICES:
+            if f"{name}_data" in data.files:
+                arrays[name] = sp.csr_matrix(
+                    (
+                        data[f"{name}_data"],
+                        data[f"{name}_indices"],
+                        data[f"{name}_indptr"],
+                    ),
+                    shape=tuple(data[f"{name}_shape"]),
+                )
+
+    model = MatrixModel(
+        header["T"],
+        arrays["c"],
+        arrays["A_eq"],
+        arrays["b_eq"],
+        arrays["lb"],
+        arrays["ub"],
+        arrays.get("A_ub"),
+        arrays.get("b_ub"),
+        header["segments"],
+        header["dt"],
+    )
+    return model, header["metadata"]
+
+
+def build_artifact(
+    df: pd.DataFrame,
+    solar_cap: int,
+    wind_cap: int,
+    battery_cap: int,
+    energy_cap: int,
+    grid_cap: int,
+    start_charge: int,
+    path,
+    params=None,
+    dt=None,
+):
+    # Build the model of LP.solve_model and save it to path, recording the
+    # capacities, battery parameters and a hash of the profile. Returns the
+    # model.
+    from cache import cache_key
+
+    params = BatteryParams() if params is None else params
+    dt = time_step(df, dt)
+    caps = (solar_cap, wind_cap, battery_cap, energy_cap, grid_cap)
+    model = build_model(df, *caps, start_charge, params=params, dt=dt)
+    metadata = {
+        "rows": df.shape[0],
+        "dt": dt,
+        "caps": {
+            "solar_cap": solar_cap,
+            "wind_cap": wind_cap,
+            "battery_cap": battery_cap,
+            "energy_cap": energy_cap,
+            "grid_cap": grid_cap,
+        },
+        "start_charge": start_charge,
+        "battery": params.as_dict(),
+        "key": cache_key(df, *caps, start_charge, params),
+    }
+    save_model(model, path, metadata)
+    return model
+
+
+def cached_model(
+    df: pd.DataFrame,
+    solar_cap: int,
+    wind_cap: int,
+    battery_cap: int,
+    energy_cap: int,
+    grid_cap: int,
+    start_charge: int,
+    directory,
+    params=None,
+    dt=None,
+):
+    # The model of LP.solve_model, loaded from directory when the same
+    # profile and configuration (see cache.cache_key) were built before and
+    # saved there otherwise
+    from cache import cache_key
+
+    caps = (solar_cap, wind_cap, battery_cap, energy_cap, grid_cap)
+    if dt is not None:
+        df = df.copy()
+        df.attrs["dt"] = dt
+    key = cache_key(df, *caps, start_charge, params)
+    path = os.path.join(directory, f"{key}.npz")
+    if os.path.exists(path):
+        return load_model(path)[0]
+    os.makedirs(directory, exist_ok=True)
+    return build_artifact(df, *caps, start_charge, path, params)
+
+
+def write_mps(model: MatrixModel, path):
+    # Write model in free MPS format, which most LP solvers read, e.g. to
+    # hand a problem to another solver's command line tool. Columns are
+    # named x<j>, equality rows e<i> and inequality rows u<i>.
+    rows = [f"e{i}" for i in range(model.A_eq.shape[0])]
+    A = model.A_eq
+    if model.A_ub is not None:
+        rows += [f"u{i}" for i in range(model.A_ub.shape[0])]
+        A = sp.vstack([A, model.A_ub])
+    A = sp.csc_matrix(A)
+
+    lines = ["NAME battery", "ROWS", " N cost"]
+    lines += [f" E {row}" for row in rows[: model.A_eq.shape[0]]]
+    lines += [f" L {row}" for row in rows[model.A_eq.shape[0] :]]
+
+    # Python floats, whose repr round-trips exactly
+    cost = model.c.tolist()
+    indptr, indices, data = (
+        A.indptr.tolist(),
+        A.indices.tolist(),
+        A.data.tolist(),
+    )
+    lines.append("COLUMNS")
+    for j in range(model.n_vars):
+        if cost[j]:
+            lines.append(f" x{j} cost {cost[j]!r}")
+        for k in range(indptr[j], indptr[j + 1]):
+            lines.append(f" x{j} {rows[indices[k]]} {data[k]!r}")
+
+    lines.append("RHS")
+    rhs = model.b_eq
+    if model.A_ub is not None:
+        rhs = np.concatenate([rhs, model.b_ub])
+    lines += [f" rhs {rows[i]} {rhs[i].item()!r}" for i in np.flatnonzero(rhs)]
+
+    lines.append("BOUNDS")
+    for j, (lo, hi) in enumerate(zip(model.lb.tolist(), model.ub.tolist())):
+        if lo == hi:
+            lines.append(f" FX bnd x{j} {lo!r}")
+            continue
+        if lo == -np.inf:
+            lines.append(f" MI bnd x{j}")
+        elif lo:
+            lines.append(f" LO bnd x{j} {lo!r}")
+        if hi != np.inf:
+            lines.append(f" UP bnd x{j} {hi!r}")
+    lines.append("ENDATA")
+
+    with open(path, "w") as f:
+        f.write("\n".join(lines) + "\n")
+    return path
+
+
+def cli(argv=None):
+    from backends import get_backend
+    from profiles import load_profile
+
+    parser = argparse.ArgumentParser(
+        description="Save built models and replay them against a solver"
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    build = commands.add_parser("build", help="build a model and save it")
+    build.add_argument("profile")
+    build.add_argument("out")
+    build.add_argument("--solar", type=float, default=0)
+    build.add_argument("--wind", type=float, default=0)
+    build.add_argument("--battery", type=float, default=10)
+    build.add_argument("--energy", type=float, default=40)
+    build.add_argument("--grid", type=float, default=10)
+    build.add_argument("--days", type=int, default=365)
+    build.add_argument("--start-soc", type=float, default=0.5)
+
+    solve = commands.add_parser("solve", help="solve a saved model")
+    solve.add_argument("model")
+    solve.add_argument("--backend", default="highs")
+
+    mps = commands.add_parser("mps", help="export a saved model as MPS")
+    mps.add_argument("model")
+    mps.add_argument("out")
+    args = parser.parse_args(argv)
+
+    if args.command == "build":
+        df = load_profile(args.profile)
+        df = df.head(round(args.days * 24 / time_step(df)))
+        # Solar and Wind in the profile are per MW installed
+        df["Solar"] = df["Solar"] * args.solar
+        df["Wind"] = df["Wind"] * args.wind
+        start = time.time()
+        model = build_artifact(
+            df,
+            args.solar,
+            args.wind,
+            args.battery,
+            args.energy,
+            args.grid,
+            args.start_soc * args.energy,
+            args.out,
+        )
+        print(
+            f"{args.out}: {model.n_vars} variables, "
+            f"{model.A_eq.nnz} nonzeros in {time.time() - start:.2f} s"
+        )
+    elif args.command == "solve":
+        start = time.time()
+        model, _ = load_model(args.model)
+        loaded = time.time() - start
+        solution = get_backend(args.backend).solve(model)
+        revenue = None if solution.x is None else model.revenue(solution.x)
+        print(
+            f"{solution.status}: revenue {revenue}, loaded in {loaded:.2f} s, "
+            f"solved in {solution.time:.2f} s "
+            f"({solution.iterations} iterations)"
+        )
+    else:
+        model, _ = load_model(args.model)
+        print(write_mps(model, args.out))
+
+
+if __name__ == "__main__":
+    cli()
@@ -0,0 +1,392 @@
+import time
+
+import numpy as np
+import scipy.sparse as sp
+
+
+class Solution:
+    # x are primal values, objective is c @ x of the (minimisation) model and
+    # duals are the marginals of the objective w.r.t. b_eq
+    def __init__(
+        self, x, objective, status, duals=None, iterations=None, time=None
+    ):
+        self.x = x
+        self.objective = objective
+        self.status = status
+        self.duals = duals
+        self.iterations = iterations
+        self.time = time
+
+    @property
+    def optimal(self):
+        return self.status == "Optimal"
+
+
+class Backend:
+    name = None
+    # Solver modules imported on the first solve; jobs.worker_context
+    # preloads them into the parent of worker processes
+    modules = ()
+
+    def solve(self, model):
+        raise NotImplementedError
+
+
+class HighsBackend(Backend):
+    # In-process HiGHS through scipy.optimize.linprog
+    name = "highs"
+    modules = ("scipy.optimize",)
+
+    STATUS = {
+        0: "Optimal",
+        1: "Not Solved",
+        2: "Infeasible",
+        3: "Unbounded",
+        4: "Not Solved",
+    }
+
+    def __init__(self, time_limit=None):
+        # Seconds, or None for no limit
+        self.time_limit = time_limit
+
+    def solve(self, model):
+        from scipy.optimize import linprog
+
+        start = time.time()
+        options = {}
+        if self.time_limit is not None:
+            options["time_limit"] = self.time_limit
+        res = linprog(
+            model.c,
+            A_ub=model.A_ub,
+            b_ub=model.b_ub,
+            A_eq=model.A_eq,
+            b_eq=model.b_eq,
+            bounds=np.column_stack([model.lb, model.ub]),
+            method="highs",
+            options=options,
+        )
+        duals = None
+        if res.status == 0:
+            duals = res.eqlin.marginals
+        return Solution(
+            res.x,
+            res.fun,
+            self.STATUS[res.status],
+            duals=duals,
+            iterations=res.nit,
+            time=time.time() - start,
+        )
+
+
+class HighspyBackend(Backend):
+    # HiGHS called directly through its own python bindings (optional). The
+    # Highs object from load() keeps its basis, so changing bounds or costs
+    # on it and calling run() again warm starts from the previous solve.
+    name = "highspy"
+    modules = ("highspy",)
+
+    def __init__(self, time_limit=None):
+        # Seconds per run(), or None for no limit
+        self.time_limit = time_limit
+
+    def load(self, model):
+        try:
+            import highspy
+        except ImportError:
+            raise ImportError(
+                "The 'highspy' backend needs the highspy package installed"
+            )
+
+        h = highspy.Highs()
+        h.setOptionValue("output_flag", False)
+        if self.time_limit is not None:
+            h.setOptionValue("time_limit", float(self.time_limit))
+        h.passModel(_highs_lp(highspy, model))
+        return h
+
+    def run(self, h, n_eq, start=None):
+        start = time.time() if start is None else start
+        h.run()
+
+        status = h.modelStatusToString(h.getModelStatus())
+        if status != "Optimal":
+            return Solution(None, None, status, time=time.time() - start)
+
+        solution = h.getSolution()
+        info = h.getInfo()
+        return Solution(
+            np.asarray(solution.col_value),
+            info.objective_function_value,
+            status,
+            duals=np.asarray(solution.row_dual)[:n_eq],
+            iterations=info.simplex_iteration_count,
+            time=time.time() - start,
+        )
+
+    def solve(self, model):
+        start = time.time()
+        return self.run(self.load(model), model.A_eq.shape[0], start)
+
+
+def _highs_lp(highspy, model):
+    # Equality rows first, then the inequality rows with no lower bound
+    A = model.A_eq
+    row_lower = model.b_eq
+    row_upper = model.b_eq
+    if model.A_ub is not None:
+        A = sp.vstack([A, model.A_ub])
+        row_lower = np.concatenate(
+            [row_lower, np.full(model.A_ub.shape[0], -highspy.kHighsInf)]
+        )
+        row_upper = np.concatenate([row_upper, model.b_ub])
+    A = sp.csc_matrix(A)
+
+    lp = highspy.HighsLp()
+    lp.num_col_ = model.n_vars
+    lp.num_row_ = A.shape[0]
+    lp.col_cost_ = model.c
+    lp.col_lower_ = model.lb
+    lp.col_upper_ = model.ub
+    lp.row_lower_ = row_lower
+    lp.row_upper_ = row_upper
+    lp.a_matrix_.format_ = highspy.MatrixFormat.kColwise
+    lp.a_matrix_.start_ = A.indptr
+    lp.a_matrix_.index_ = A.indices
+    lp.a_matrix_.value_ = A.data
+    return lp
+
+
+class CbcBackend(Backend):
+    # PuLP's bundled CBC binary, i.e. the original solve path
+    name = "cbc"
+    modules = ("pulp",)
+
+    def solve(self, model):
+        import pulp as p
+
+        start = time.time()
+        prob = p.LpProblem("Model", p.LpMinimize)
+        xs = [
+            p.LpVariable(f"x_{j}", lowBound=model.lb[j], upBound=model.ub[j])
+            for j in range(model.n_vars)
+        ]
+        prob += p.LpAffineExpression(
+            [(xs[j], model.c[j]) for j in np.flatnonzero(model.c)]
+        )
+
+        eq = _add_rows(p, prob, xs, model.A_eq, model.b_eq, p.LpConstraintEQ)
+        if model.A_ub is not None:
+            _add_rows(p, prob, xs, model.A_ub, model.b_ub, p.LpConstraintLE)
+
+        status = p.LpStatus[prob.solve(p.PULP_CBC_CMD(msg=False))]
+        if status != "Optimal":
+            return Solution(None, None, status, time=time.time() - start)
+
+        x = np.fromiter(
+            (v.varValue or 0.0 for v in xs), dtype=float, count=len(xs)
+        )
+        duals = np.fromiter(
+            (con.pi or 0.0 for con in eq), dtype=float, count=len(eq)
+        )
+        return Solution(
+            x,
+            model.c @ x,
+            status,
+            duals=duals,
+            time=time.time() - start,
+        )
+
+
+def _add_rows(p, prob, xs, A, b, sense):
+    A = sp.csr_matrix(A)
+    cons = []
+    for i in range(A.shape[0]):
+        cols = A.indices[A.indptr[i] : A.indptr[i + 1]]
+        vals = A.data[A.indptr[i] : A.indptr[i + 1]]
+        con = p.LpConstraint(
+            p.LpAffineExpression([(xs[j], v) for j, v in zip(cols, vals)]),
+            sense=sense,
+            rhs=b[i],
+            name=f"c_{len(prob.constraints)}",
+        )
+        prob += con
+        cons.append(con)
+    return cons
+
+
+class SimplexBackend(Backend):
+    # Dense two-phase simplex in NumPy. Needs no solver at all, but is only
+    # practical for short horizons (a few days).
+    name = "simplex"
+
+    def __init__(self, tol=1e-9, max_iter=50000):
+        self.tol = tol
+        self.max_iter = max_iter
+
+    def solve(self, model):
+        start = time.time()
+        n = model.n_vars
+        lb, ub = model.lb, model.ub
+        if not np.isfinite(lb).all():
+            raise ValueError("The simplex backend needs finite lower bounds")
+
+        # Shift to y = x - lb >= 0 and turn finite upper bounds into rows
+        finite = np.flatnonzero(np.isfinite(ub))
+        A_eq = sp.csr_matrix(model.A_eq).toarray()
+        n_eq = A_eq.shape[0]
+        n_ub = 0 if model.A_ub is None else model.A_ub.shape[0]
+        n_rows = n_eq + n_ub + len(finite)
+        n_cols = n + len(finite) + n_ub
+
+        A = np.zeros((n_rows, n_cols))
+        b = np.zeros(n_rows)
+        A[:n_eq, :n] = A_eq
+        b[:n_eq] = model.b_eq - A_eq @ lb
+        if n_ub:
+            A_ub = sp.csr_matrix(model.A_ub).toarray()
+            rows = slice(n_eq, n_eq + n_ub)
+            A[rows, :n] = A_ub
+            A[rows, n + len(finite) :] = np.eye(n_ub)
+            b[rows] = model.b_ub - A_ub @ lb
+        rows = np.arange(n_eq + n_ub, n_rows)
+        A[rows, finite] = 1.0
+        A[rows, n + np.arange(len(finite))] = 1.0
+        b[rows] = ub[finite] - lb[finite]
+
+        sign = np.where(b < 0, -1.0, 1.0)
+        A *= sign[:, None]
+        b *= sign
+
+        cost = np.zeros(n_cols)
+        cost[:n] = model.c
+        status, y, duals, iterations = _simplex(
+            A, b, cost, self.tol, self.max_iter
+        )
+        if status != "Optimal":
+            return Solution(
+                None,
+                None,
+                status,
+                iterations=iterations,
+                time=time.time() - start,
+            )
+
+        x = lb + y[:n]
+        return Solution(
+            x,
+            model.c @ x,
+            status,
+            duals=(duals * sign)[:n_eq],
+            iterations=iterations,
+            time=time.time() - start,
+        )
+
+
+def _simplex(A, b, cost, tol, max_iter):
+    # Tableau simplex on min cost @ y s.t. A @ y == b, y >= 0 with b >= 0.
+    # One artificial column per row gives the phase I starting basis.
+    m, n = A.shape
+    tab = np.zeros((m + 1, n + m + 1))
+    tab[:m, :n] = A
+    tab[:m, n : n + m] = np.eye(m)
+    tab[:m, -1] = b
+    basis = np.arange(n, n + m)
+
+    tab[m, :n] = -A.sum(axis=0)
+    tab[m, -1] = -b.sum()
+    status, iterations = _pivot_loop(tab, basis, n, tol, max_iter)
+    if status != "Optimal":
+        return status, None, None, iterations
+    if -tab[m, -1] > tol * max(1.0, b.sum()):
+        return "Infeasible", None, None, iterations
+
+    # Drive any artificials left in the basis out, dropping redundant rows
+    keep = np.ones(m, dtype=bool)
+    for i in np.flatnonzero(basis >= n):
+        cols = np.flatnonzero(np.abs(tab[i, :n]) > tol)
+        if len(cols):
+            _pivot(tab, basis, i, cols[0])
+        else:
+            keep[i] = False
+
+    tab[m, :] = 0.0
+    tab[m, :n] = cost
+    for i in np.flatnonzero(keep):
+        if cost[basis[i]] != 0:
+            tab[m] -= cost[basis[i]] * tab[i]
+    tab[~np.append(keep, True), -1] = 0.0
+
+    status, more = _pivot_loop(tab, basis, n, tol, max_iter, rows=keep)
+    iterations += more
+    if status != "Optimal":
+        return status, None, None, iterations
+
+    y = np.zeros(n + m)
+    y[basis[keep]] = tab[:m, -1][keep]
+    duals = -tab[m, n : n + m]
+    duals[~keep] = 0.0
+    return status, y[:n], duals, iterations
+
+
+def _pivot_loop(tab, basis, n, tol, max_iter, rows=None):
+    # Dantzig's rule, falling back to Bland's rule once pivots stall so that
+    # degenerate problems cannot cycle
+    m = tab.shape[0] - 1
+    active = np.ones(m, dtype=bool) if rows is None else rows
+    bland = False
+    stalled = 0
+    for it in range(max_iter):
+        reduced = tab[m, :n]
+        if bland:
+            candidates = np.flatnonzero(reduced < -tol)
+            if not len(candidates):
+                return "Optimal", it
+            j = candidates[0]
+        else:
+            j = np.argmin(reduced)
+            if reduced[j] >= -tol:
+                return "Optimal", it
+
+        col = tab[:m, j]
+        ok = active & (col > tol)
+        if not ok.any():
+            return "Unbounded", it
+        ratios = np.full(m, np.inf)
+        ratios[ok] = tab[:m, -1][ok] / col[ok]
+        best = ratios.min()
+        ties = np.flatnonzero(ratios <= best + tol)
+        i = ties[np.argmin(basis[ties])] if bland else ties[0]
+
+        stalled = stalled + 1 if best <= tol else 0
+        if stalled > 50:
+            bland = True
+        _pivot(tab, basis, i, j)
+    return "Not Solved", max_iter
+
+
+def _pivot(tab, basis, i, j):
+    tab[i] /= tab[i, j]
+    factor = tab[:, j].copy()
+    factor[i] = 0.0
+    tab -= np.outer(factor, tab[i])
+    basis[i] = j
+
+
+BACKENDS = {
+    backend.name: backend
+    for backend in (HighsBackend, HighspyBackend, CbcBackend, SimplexBackend)
+}
+
+
+def get_backend(backend, **options):
+    # options (e.g. time_limit) are passed to a backend given by name
+    if isinstance(backend, Backend):
+        return backend
+    try:
+        cls = BACKENDS[backend]
+    except KeyError:
+        raise ValueError(
+            f"Unknown backend '{backend}', choose from {sorted(BACKENDS)}"
+        )
+    return cls(**options)
@@ -0,0 +1,195 @@
+# Headless runs of scenario files, e.g. from cron:
+#   python batch.py scenarios.yaml --out results/ --format parquet
+#
+# A scenario file (YAML or JSON) holds a list of scenarios, or a mapping with
+# "scenarios" and optional "defaults" applied to each of them:
+#   defaults:
+#     profile: 8760_data.csv   # relative to the scenario file
+#     days: 7                  # or hours; from start_hour (default 0)
+#     start_soc: 0.5           # or start_charge in MWh
+#   scenarios:
+#     - name: hybrid
+#       solar_cap: 30
+#       wind_cap: 10
+#       battery_cap: 10
+#       energy_cap: 40
+#       grid_cap: 10
+#       charge_eff: 0.92       # any battery.BatteryParams field
+#       terminal_soc: 0.5
+# Solar and Wind in the profile are per MW installed unless per_mw is false.
+import argparse
+import json
+import logging
+import os
+import sys
+
+import pandas as pd
+
+from battery import FIELDS, BatteryParams
+from LP import solve_model
+from profiles import load_profile
+from sweep import PARAMETERS
+
+logger = logging.getLogger(__name__)
+
+# Used when a scenario names no profile, wherever the batch is run from
+DEFAULT_PROFILE = os.path.join(os.path.dirname(__file__), "8760_data.csv")
+
+SUMMARY_COLUMNS = (
+    "name",
+    *PARAMETERS,
+    "start_charge",
+    "hours",
+    "revenue",
+    "gross_revenue",
+    "cycles",
+    "solve_time",
+    "status",
+)
+
+
+def load_scenarios(path):
+    with open(path) as f:
+        if path.endswith((".yaml", ".yml")):
+            try:
+                import yaml
+            except ImportError:
+                raise ImportError("Reading YAML scenarios needs PyYAML")
+            spec = yaml.safe_load(f)
+        else:
+            spec = json.load(f)
+
+    if isinstance(spec, list):
+        spec = {"scenarios": spec}
+    defaults = spec.get("defaults", {})
+    base_dir = os.path.dirname(os.path.abspath(path))
+
+    scenarios = []
+    for i, scenario in enumerate(spec["scenarios"]):
+        scenario = {"name": f"scenario_{i}", **defaults, **scenario}
+        if "profile" in scenario:
+            scenario["profile"] = os.path.join(base_dir, scenario["profile"])
+        scenarios.append(scenario)
+    return scenarios
+
+
+def run_scenario(scenario, backend="highs"):
+    # Solve one scenario; returns (hourly results, summary row). Nothing in
+    # the scenario or the profile is modified.
+    start = scenario.get("start_hour", 0)
+    hours = scenario.get("hours", 24 * scenario.get("days", 365))
+    df = load_profile(
+        scenario.get("profile", DEFAULT_PROFILE), start, start + hours
+    )
+
+    caps = {name: scenario.get(name, 0) for name in PARAMETERS}
+    if scenario.get("per_mw", True):
+        df["Solar"] = df["Solar"] * caps["solar_cap"]
+        df["Wind"] = df["Wind"] * caps["wind_cap"]
+    start_charge = scenario.get(
+        "start_charge", scenario.get("start_soc", 0.5) * caps["energy_cap"]
+    )
+
+    df, revenue, solve_time, stats = solve_model(
+        df,
+        *(caps[name] for name in PARAMETERS),
+        start_charge,
+        backend=scenario.get("backend", backend),
+        engine=scenario.get("engine", "auto"),
+        return_stats=True,
+        params=BatteryParams(
+            **{k: scenario[k] for k in FIELDS if k in scenario}
+        ),
+    )
+    summary = {
+        "name": scenario["name"],
+        **caps,
+        "start_charge": start_charge,
+        "hours": df.shape[0],
+        "revenue": revenue,
+        "gross_revenue": stats.counters["gross_revenue"],
+        "cycles": stats.counters["equivalent_cycles"],
+        "solve_time": solve_time,
+        "status": stats.counters["status"],
+    }
+    return df, summary
+
+
+def run_batch(scenarios, backend="highs"):
+    # Yields (name, hourly results or None, summary row) per scenario. A
+    # scenario that fails is reported in its row instead of stopping the
+    # batch.
+    for scenario in scenarios:
+        try:
+            df, summary = run_scenario(scenario, backend)
+        except Exception as e:
+            logger.exception("Scenario '%s' failed", scenario["name"])
+            yield scenario["name"], None, {
+                "name": scenario["name"],
+                "status": f"Error: {e}",
+            }
+        else:
+            logger.info(
+                "Scenario '%s': revenue %.2f in %.2f s",
+                summary["name"],
+                summary["revenue"],
+                summary["solve_time"],
+            )
+            yield scenario["name"], df, summary
+
+
+def _write(df, path, fmt):
+    if fmt == "parquet":
+        df.to_parquet(path, index=False)
+    else:
+        df.to_csv(path, index=False)
+
+
+def cli(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Solve the scenarios of YAML/JSON files"
+    )
+    parser.add_argument("scenarios", nargs="+")
+    parser.add_argument("--out", default=".", help="output directory")
+    parser.add_argument("--format", choices=("csv", "parquet"), default="csv")
+    parser.add_argument(
+        "--summary-only",
+        action="store_true",
+        help="skip the hourly results of each scenario",
+    )
+    parser.add_argument("--backend", default="highs")
+    parser.add_argument("-v", "--verbose", action="store_true")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(
+        level=logging.INFO if args.verbose else logging.WARNING,
+        format="%(asctime)s %(levelname)s %(message)s",
+    )
+    os.makedirs(args.out, exist_ok=True)
+
+    rows = []
+    for path in args.scenarios:
+        for name, df, summary in run_batch(load_scenarios(path), args.backend):
+            rows.append(summary)
+            if df is not None and not args.summary_only:
+                _write(
+                    df,
+                    os.path.join(args.out, f"{name}.{args.format}"),
+                    args.format,
+                )
+
+    summary = pd.DataFrame(rows, columns=SUMMARY_COLUMNS)
+    _write(
+        summary, os.path.join(args.out, f"summary.{args.format}"), args.format
+    )
+
+    # Non-zero exit status for the scheduler when any scenario failed
+    failed = summary["status"] != "Optimal"
+    if failed.any():
+        logger.error("%d of %d scenarios failed", failed.sum(), len(summary))
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(cli())
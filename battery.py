@@ -0,0 +1,106 @@
+import numpy as np
+
+import constants as c
+
+
+class BatteryParams:
+    # Battery physics for one solve. Fractions are of energy_cap:
+    #   charge_eff / discharge_eff  battery losses on the way in / out
+    #   inverter_eff                DC-AC (and AC-DC) conversion efficiency
+    #   self_discharge              share of the SOC lost every hour
+    #   soc_min / soc_max           allowed SOC range
+    #   terminal_soc                least SOC left at the end (None: free)
+    #   max_daily_cycles            cap on the energy taken out of the
+    #                               battery per day, in full cycles (None:
+    #                               no limit)
+    #   throughput_cost             degradation cost ($/MWh) of energy
+    #                               taken out of the battery
+    #   dod_costs                   extra cost ($/MWh) of discharging each
+    #                               of len(dod_costs) equal SOC segments,
+    #                               from the top of the battery down; must
+    #                               not decrease, so deep cycles cost more
+    # The efficiencies default to constants.py.
+    def __init__(
+        self,
+        charge_eff=None,
+        discharge_eff=None,
+        inverter_eff=None,
+        self_discharge=0.0,
+        soc_min=0.0,
+        soc_max=1.0,
+        terminal_soc=None,
+        max_daily_cycles=None,
+        throughput_cost=0.0,
+        dod_costs=None,
+    ):
+        self.charge_eff = c.BATTERY_EFF if charge_eff is None else charge_eff
+        self.discharge_eff = (
+            c.BATTERY_EFF if discharge_eff is None else discharge_eff
+        )
+        self.inverter_eff = (
+            c.INVERTER_EFF if inverter_eff is None else inverter_eff
+        )
+        self.self_discharge = self_discharge
+        self.soc_min = soc_min
+        self.soc_max = soc_max
+        self.terminal_soc = terminal_soc
+        self.max_daily_cycles = max_daily_cycles
+        self.throughput_cost = throughput_cost
+        self.dod_costs = None if dod_costs is None else tuple(dod_costs)
+
+        for name in ("charge_eff", "discharge_eff", "inverter_eff"):
+            if not 0 < getattr(self, name) <= 1:
+                raise ValueError(f"{name} must be in (0, 1]")
+        if not 0 <= self_discharge < 1:
+            raise ValueError("self_discharge must be in [0, 1)")
+        if not 0 <= soc_min <= soc_max <= 1:
+            raise ValueError("Need 0 <= soc_min <= soc_max <= 1")
+        if terminal_soc is not None and not soc_min <= terminal_soc <= soc_max:
+            raise ValueError("terminal_soc must be within soc_min/soc_max")
+        if max_daily_cycles is not None and max_daily_cycles < 0:
+            raise ValueError("max_daily_cycles must be non-negative")
+        if throughput_cost < 0:
+            raise ValueError("throughput_cost must be non-negative")
+        if self.dod_costs is not None and (
+            not self.dod_costs
+            or min(self.dod_costs) < 0
+            or np.any(np.diff(self.dod_costs) < 0)
+        ):
+            raise ValueError("dod_costs must be non-negative and not decrease")
+
+    @property
+    def is_simple(self):
+        # Only losses, an SOC range and a throughput cost, as handled by
+        # arbitrage.dispatch
+        return (
+            self.self_discharge == 0
+            and self.terminal_soc is None
+            and self.max_daily_cycles is None
+            and self.dod_costs is None
+        )
+
+    def equivalent_cycles(self, discharge, energy_cap, dt=1.0):
+        # Full cycles' worth of energy taken out of the battery, given the
+        # discharge (MW at the battery terminals) of every step of dt hours
+        if energy_cap == 0:
+            return 0.0
+        return float(dt * np.sum(discharge) / self.discharge_eff / energy_cap)
+
+    def as_dict(self):
+        return dict(vars(self))
+
+    def replace(self, **changes):
+        return BatteryParams(**{**self.as_dict(), **changes})
+
+    def __eq__(self, other):
+        return (
+            isinstance(other, BatteryParams)
+            and self.as_dict() == other.as_dict()
+        )
+
+    def __repr__(self):
+        fields = ", ".join(f"{k}={v!r}" for k, v in self.as_dict().items())
+        return f"BatteryParams({fields})"
+
+
+FIELDS = tuple(BatteryParams().as_dict())
@@ -0,0 +1,406 @@
+# Benchmarks of the model build, solve and extraction phases. From a terminal:
+#   python benchmark.py --out before.json
+#   (change something)
+#   python benchmark.py --out after.json --compare before.json
+# or, for module import times and worker pool start-up:
+#   python benchmark.py --startup
+# or, to check that the arbitrage engine and the simplex backend still give
+# the revenue of HiGHS on random cases (exits with 1 when one does not):
+#   python benchmark.py --check
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+import scipy
+
+from backends import get_backend
+from battery import BatteryParams
+from jobs import worker_context
+from LP import solve_model
+from matrix_model import attach_solution, build_model
+
+HORIZON_DAYS = (1, 7, 30, 90, 365)
+
+# solar_cap, wind_cap, battery_cap, energy_cap, grid_cap
+MIXES = {
+    "solar": (50, 0, 10, 50, 10),
+    "hybrid": (30, 10, 10, 40, 10),
+    "storage": (0, 0, 10, 40, 10),
+}
+
+PHASES = ("build", "solve", "extract", "total")
+
+# Lengths (steps, short enough for the dense simplex backend) and time steps
+# (hours) of the random --check cases
+CHECK_STEPS = (12, 24, 36)
+CHECK_DT = (1.0, 0.5, 0.25)
+
+# Entry points whose cold import time is measured by --startup
+IMPORT_MODULES = ("jobs", "LP", "sweep", "batch", "charts")
+
+# (start method, preloaded) pools whose start-up is measured by --startup.
+# Cold pools come first, as a warm fork leaves the solver imported here, and
+# the forkserver only once, as there is a single server per process.
+POOLS = (
+    ("spawn", False),
+    ("fork", False),
+    ("forkserver", True),
+    ("fork", True),
+)
+
+
+def cases(days=HORIZON_DAYS, mixes=MIXES):
+    # (name, profile, caps) for the home page day and each slice/mix of the
+    # yearly profile, whose Solar and Wind are per MW installed
+    yield "24hours", pd.read_csv("24hours.csv"), MIXES["solar"]
+    year = pd.read_csv("8760_data.csv")
+    for n in days:
+        for mix in mixes:
+            caps = MIXES[mix]
+            df = year.head(n * 24).copy()
+            df["Solar"] = df["Solar"] * caps[0]
+            df["Wind"] = df["Wind"] * caps[1]
+            yield f"{n}d-{mix}", df, caps
+
+
+def run_once(df, caps, backend):
+    start = time.perf_counter()
+    model = build_model(df, *caps, 0.5 * caps[3])
+    built = time.perf_counter()
+    solution = backend.solve(model)
+    solved = time.perf_counter()
+    revenue = None
+    if solution.x is not None:
+        revenue = attach_solution(df.copy(), model, solution)
+    extracted = time.perf_counter()
+    timings = {
+        "build": built - start,
+        "solve": solved - built,
+        "extract": extracted - solved,
+        "total": extracted - start,
+    }
+    return timings, solution, revenue
+
+
+def bench_case(df, caps, backend, repeat):
+    # Best of `repeat` timed runs, then one traced run for peak memory
+    runs = [run_once(df, caps, backend) for _ in range(repeat)]
+    timings = {p: min(r[0][p] for r in runs) for p in PHASES}
+    _, solution, revenue = runs[-1]
+
+    tracemalloc.start()
+    run_once(df, caps, backend)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "steps": df.shape[0],
+        **timings,
+        "peak_mb": peak / 2**20,
+        "iterations": solution.iterations,
+        "status": solution.status,
+        "revenue": revenue,
+    }
+
+
+def import_time(module, repeat=3):
+    # Best wall time of importing module in a fresh interpreter, or None
+    # when it cannot be imported (e.g. a missing optional dependency)
+    code = (
+        "import time; start = time.perf_counter(); "
+        f"import {module}; print(time.perf_counter() - start)"
+    )
+    times = []
+    for _ in range(repeat):
+        out = subprocess.run(
+            [sys.executable, "-c", code],
+            capture_output=True,
+            text=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        )
+        if out.returncode:
+            return None
+        times.append(float(out.stdout))
+    return min(times)
+
+
+def _first_solve(_):
+    # What a sweep worker does before its first scenario: a one-day solve,
+    # which imports the solver
+    df = pd.DataFrame(
+        {
+            "Solar": np.zeros(24),
+            "Wind": np.zeros(24),
+            "Price": np.arange(24.0),
+        }
+    )
+    return get_backend("highs").solve(build_model(df, *MIXES["storage"], 20))
+
+
+def pool_startup(method, processes, warm):
+    # Seconds from creating a pool to every worker finishing a first solve.
+    # warm preloads the workers through jobs.worker_context.
+    if warm:
+        context = worker_context(method)
+    else:
+        import multiprocessing as mp
+
+        context = mp.get_context(method)
+    start = time.perf_counter()
+    with context.Pool(processes) as pool:
+        pool.map(_first_solve, range(processes), chunksize=1)
+    return time.perf_counter() - start
+
+
+def run_startup(processes=None, repeat=3):
+    processes = processes or os.cpu_count()
+    results = {}
+    for module in IMPORT_MODULES:
+        seconds = import_time(module, repeat)
+        if seconds is None:
+            print(f"{module:>20}: not importable", file=sys.stderr)
+            continue
+        results[f"import-{module}"] = {"total": seconds}
+        print(f"{module:>20}: import {seconds:.4f}s", file=sys.stderr)
+
+    for method, warm in POOLS:
+        name = f"pool-{method}-{'warm' if warm else 'cold'}"
+        seconds = pool_startup(method, processes, warm)
+        results[name] = {"total": seconds}
+        print(f"{name:>20}: start {seconds:.4f}s", file=sys.stderr)
+
+    return {
+        "meta": {
+            "commit": _commit(),
+            "processes": processes,
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+        },
+        "results": results,
+    }
+
+
+def random_case(rng, storage_only):
+    # (profile, caps, start_charge, params) of a random short case. Storage
+    # only cases have no VRE, non-negative prices and only the battery
+    # features arbitrage.dispatch handles; the others may have all of them.
+    dt = float(rng.choice(CHECK_DT))
+    T = int(rng.choice(CHECK_STEPS))
+    low = 0 if storage_only else -20
+    price = np.where(rng.random(T) < 0.1, 0.0, rng.uniform(low, 100, T))
+    caps = [0.0, 0.0, *rng.uniform(1, [20, 80, 20])]
+    if not storage_only:
+        caps[:2] = rng.uniform(0, 30, 2)
+    df = pd.DataFrame(
+        {
+            "Solar": caps[0] * rng.random(T),
+            "Wind": caps[1] * rng.random(T),
+            "Price": price,
+        }
+    )
+    df.attrs["dt"] = dt
+
+    soc_min, soc_max = rng.uniform(0, 0.3), rng.uniform(0.7, 1)
+    start = rng.uniform(soc_min, soc_max)
+    options = {
+        "charge_eff": rng.uniform(0.8, 1),
+        "discharge_eff": rng.uniform(0.8, 1),
+        "inverter_eff": rng.uniform(0.8, 1),
+        "soc_min": soc_min,
+        "soc_max": soc_max,
+        "throughput_cost": rng.choice([0, rng.uniform(0, 10)]),
+    }
+    if not storage_only:
+        # Targets below the start SOC, so that every case is feasible
+        options["self_discharge"] = rng.uniform(0, 0.002)
+        if rng.random() < 0.5:
+            options["terminal_soc"] = (soc_min + start) / 2
+        if rng.random() < 0.5:
+            options["max_daily_cycles"] = rng.uniform(0.5, 2)
+        if rng.random() < 0.5:
+            options["dod_costs"] = np.sort(rng.uniform(0, 5, 2))
+    params = BatteryParams(**options)
+    return df, tuple(caps), start * caps[3], params
+
+
+def run_check(n_cases=40, seed=0, tol=1e-6):
+    # Revenue of the arbitrage engine (storage-only cases) and the simplex
+    # backend (all cases) against the LP solved by HiGHS, on random cases.
+    # Returns the cases whose relative difference is over tol.
+    rng = np.random.default_rng(seed)
+    failures = []
+    for i in range(n_cases):
+        storage_only = i % 2 == 0
+        df, caps, start_charge, params = random_case(rng, storage_only)
+        _, reference, _ = solve_model(
+            df, *caps, start_charge, "highs", engine="lp", params=params
+        )
+        checks = {"simplex": {"backend": "simplex", "engine": "lp"}}
+        if storage_only:
+            checks["arbitrage"] = {"engine": "arbitrage"}
+        for name, options in checks.items():
+            _, revenue, _ = solve_model(
+                df, *caps, start_charge, params=params, **options
+            )
+            error = abs(revenue - reference) / max(abs(reference), 1)
+            print(
+                f"case {i:>3} {name:>9}: {df.shape[0]:>3} steps of "
+                f"{df.attrs['dt']} h, revenue {revenue:.6f} "
+                f"(HiGHS {reference:.6f}, error {error:.1e})",
+                file=sys.stderr,
+            )
+            if error > tol:
+                failures.append(
+                    {
+                        "case": i,
+                        "check": name,
+                        "revenue": revenue,
+                        "reference": reference,
+                        "error": error,
+                    }
+                )
+    return failures
+
+
+def _commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(days=HORIZON_DAYS, mixes=MIXES, backend="highs", repeat=3):
+    solver = get_backend(backend)
+    # Untimed solve first so that solver imports are not charged to a case
+    year = pd.read_csv("8760_data.csv").head(24)
+    run_once(year, MIXES["hybrid"], solver)
+
+    results = {}
+    for name, df, caps in cases(days, mixes):
+        results[name] = bench_case(df, caps, solver, repeat)
+        print(
+            f"{name:>14}: "
+            + "  ".join(f"{p} {results[name][p]:.4f}s" for p in PHASES)
+            + f"  peak {results[name]['peak_mb']:.1f} MB",
+            file=sys.stderr,
+        )
+    return {
+        "meta": {
+            "commit": _commit(),
+            "backend": backend,
+            "repeat": repeat,
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "scipy": scipy.__version__,
+            "pandas": pd.__version__,
+            "machine": platform.machine(),
+        },
+        "results": results,
+    }
+
+
+def compare(base, new, threshold=0.2):
+    # Cases whose time or memory grew by more than `threshold` (relative)
+    regressions = []
+    for name, now in new["results"].items():
+        before = base["results"].get(name)
+        if before is None:
+            continue
+        for key in (*PHASES, "peak_mb"):
+            if key not in before or key not in now:
+                continue
+            if before[key] > 0 and now[key] > before[key] * (1 + threshold):
+                regressions.append(
+                    {
+                        "case": name,
+                        "metric": key,
+                        "before": before[key],
+                        "after": now[key],
+                        "ratio": now[key] / before[key],
+                    }
+                )
+    return regressions
+
+
+def cli(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Time the build, solve and extraction phases"
+    )
+    parser.add_argument(
+        "--days", type=lambda s: [int(v) for v in s.split(",")]
+    )
+    parser.add_argument("--mixes", type=lambda s: s.split(","))
+    parser.add_argument("--backend", default="highs")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--out", help="write the results as JSON here")
+    parser.add_argument("--compare", help="JSON results to compare against")
+    parser.add_argument("--threshold", type=float, default=0.2)
+    parser.add_argument(
+        "--startup",
+        action="store_true",
+        help="time module imports and worker pool start-up instead",
+    )
+    parser.add_argument("--processes", type=int, default=None)
+    parser.add_argument(
+        "--check",
+        action="store_true",
+        help="check the arbitrage engine and simplex backend against HiGHS",
+    )
+    parser.add_argument("--cases", type=int, default=40)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    if args.check:
+        failures = run_check(args.cases, args.seed)
+        for f in failures:
+            print(
+                f"MISMATCH case {f['case']} {f['check']}: "
+                f"{f['revenue']:.6f} vs {f['reference']:.6f} "
+                f"(error {f['error']:.1e})",
+                file=sys.stderr,
+            )
+        print(
+            f"{args.cases} cases, {len(failures)} mismatches", file=sys.stderr
+        )
+        sys.exit(1 if failures else 0)
+    if args.startup:
+        results = run_startup(args.processes, args.repeat)
+    else:
+        mixes = MIXES if args.mixes is None else args.mixes
+        results = run(
+            args.days or HORIZON_DAYS, mixes, args.backend, args.repeat
+        )
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(results, f, indent=2)
+    else:
+        json.dump(results, sys.stdout, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(json.load(f), results, args.threshold)
+        for r in regressions:
+            print(
+                f"REGRESSION {r['case']} {r['metric']}: "
+                f"{r['before']:.4g} -> {r['after']:.4g} "
+                f"(x{r['ratio']:.2f})",
+                file=sys.stderr,
+            )
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    cli()
@@ -0,0 +1,182 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from battery import BatteryParams
+from matrix_model import time_step
+from stats import SolveStats
+
+RESULT_COLUMNS = ("SOC", "IMP", "EXP")
+
+
+def cache_key(
+    df: pd.DataFrame,
+    solar_cap: int,
+    wind_cap: int,
+    battery_cap: int,
+    energy_cap: int,
+    grid_cap: int,
+    start_charge: int,
+    params=None,
+):
+    # Hash of everything the solution depends on: the profile columns the
+    # model reads and their time step, the capacities and start charge and
+    # the battery parameters (which default to the model constants)
+    battery = BatteryParams() if params is None else params
+    h = hashlib.sha256()
+    for col in ("Solar", "Wind", "Price"):
+        h.update(np.ascontiguousarray(df[col], dtype=np.float64).tobytes())
+    params = {
+        "caps": [solar_cap, wind_cap, battery_cap, energy_cap, grid_cap],
+        "start_charge": start_charge,
+        "battery": battery.as_dict(),
+        "dt": time_step(df),
+    }
+    h.update(json.dumps(params, sort_keys=True, default=float).encode())
+    return h.hexdigest()
+
+
+class ResultCache:
+    # In-memory LRU of solved results, optionally backed by a directory of
+    # .npz files that is trimmed (least recently used first) to max_bytes
+    def __init__(self, max_entries=32, directory=None, max_bytes=256 * 2**20):
+        self.max_entries = max_entries
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.npz")
+
+    def get(self, key):
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                return self._memory[key]
+
+        if not self.directory or not os.path.exists(self._path(key)):
+            return None
+        try:
+            with np.load(self._path(key)) as data:
+                value = {name: data[name] for name in data.files}
+        except (OSError, ValueError):
+            return None
+        os.utime(self._path(key))
+        self._remember(key, value)
+        return value
+
+    def put(self, key, value):
+        self._remember(key, value)
+        if self.directory:
+            tmp = self._path(key) + ".tmp.npz"
+            np.savez_compressed(tmp, **value)
+            os.replace(tmp, self._path(key))
+            self._evict_disk()
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+
+    def _remember(self, key, value):
+        with self._lock:
+            self._memory[key] = value
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_entries:
+                self._memory.popitem(last=False)
+
+    def _evict_disk(self):
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(".npz") and ".tmp" not in entry.name:
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+
+# Shared by every session of the app; set BATTERY_MODEL_CACHE to a directory
+# to keep results across restarts
+CACHE = ResultCache(directory=os.environ.get("BATTERY_MODEL_CACHE"))
+
+
+def cached_solve_model(
+    df: pd.DataFrame,
+    solar_cap: int,
+    wind_cap: int,
+    battery_cap: int,
+    energy_cap: int,
+    grid_cap: int,
+    start_charge: int,
+    cache=None,
+    solver=None,
+    hooks=(),
+    return_stats=False,
+    params=None,
+):
+    # Same as LP.solve_model, but a configuration that has been solved
+    # before is returned from the cache without calling the solver. Any
+    # function with solve_model's signature can be passed as solver.
+    if solver is None:
+        from LP import solve_model as solver
+    cache = CACHE if cache is None else cache
+    start = time.time()
+    stats = SolveStats(hooks)
+    with stats.phase("cache_lookup"):
+        key = cache_key(
+            df,
+            solar_cap,
+            wind_cap,
+            battery_cap,
+            energy_cap,
+            grid_cap,
+            start_charge,
+            params,
+        )
+
+        hit = cache.get(key)
+    stats.count(cache_hit=hit is not None)
+
+    if hit is None:
+        df, revenue, _, solved = solver(
+            df,
+            solar_cap,
+            wind_cap,
+            battery_cap,
+            energy_cap,
+            grid_cap,
+            start_charge,
+            hooks=hooks,
+            return_stats=True,
+            params=params,
+        )
+        stats.timings.update(solved.timings)
+        stats.count(**solved.counters)
+        hit = {col: df[col].to_numpy() for col in RESULT_COLUMNS}
+        hit["revenue"] = np.array(revenue)
+        cache.put(key, hit)
+    else:
+        df = df.copy()
+        for col in RESULT_COLUMNS:
+            df[col] = hit[col]
+
+    end = time.time()
+    solve_time = end - start
+    if return_stats:
+        return (df, float(hit["revenue"]), solve_time, stats)
+    return (df, float(hit["revenue"]), solve_time)
@@ -0,0 +1,158 @@
+# Chart building for the dashboard pages. Long series are downsampled to a
+# point budget before they reach Plotly, and the figures are memoised so
+# that Streamlit reruns reuse them instead of rebuilding. Plotly is only
+# imported once a figure is built.
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+# Points per series sent to the browser
+POINT_BUDGET = 2000
+
+BACKGROUND = {"plot_bgcolor": "#0E1116", "paper_bgcolor": "#0E1116"}
+GRID = {"linecolor": "#27292E", "gridcolor": "#27292E"}
+
+
+def hourly_averages(df: pd.DataFrame, columns):
+    # Average of each column by hour of the day; columns maps the column to
+    # average onto its name in the result
+    return (
+        df.groupby("Hour", as_index=False)[list(columns)]
+        .mean()
+        .rename(columns=columns)
+    )
+
+
+def minmax_indices(y, budget):
+    # The lowest and highest point of each of budget / 2 equal buckets, so
+    # peaks survive the downsampling
+    n = len(y)
+    if n <= budget:
+        return np.arange(n)
+    size = -(-n // max(budget // 2, 1))
+    buckets = -(-n // size)
+    padded = np.full(buckets * size, np.nan)
+    padded[:n] = y
+    padded = padded.reshape(buckets, size)
+    offsets = np.arange(buckets) * size
+    return np.unique(
+        np.concatenate(
+            [
+                [0, n - 1],
+                offsets + np.nanargmin(padded, axis=1),
+                offsets + np.nanargmax(padded, axis=1),
+            ]
+        )
+    )
+
+
+def lttb_indices(x, y, budget):
+    # Largest-Triangle-Three-Buckets: keeps the first and last points and,
+    # from each bucket in between, the point making the largest triangle
+    # with the previous pick and the average of the next bucket
+    n = len(y)
+    if n <= budget or budget < 3:
+        return np.arange(n)
+    edges = np.linspace(1, n - 1, budget - 1).astype(int)
+    edges = np.append(edges, n)
+    keep = np.empty(budget, dtype=int)
+    keep[0], keep[-1] = 0, n - 1
+    a = 0
+    for i in range(budget - 2):
+        lo, hi = edges[i], edges[i + 1]
+        next_x = x[hi : edges[i + 2]].mean()
+        next_y = y[hi : edges[i + 2]].mean()
+        area = np.abs(
+            (x[a] - next_x) * (y[lo:hi] - y[a])
+            - (x[a] - x[lo:hi]) * (next_y - y[a])
+        )
+        a = lo + int(area.argmax())
+        keep[i + 1] = a
+    return keep
+
+
+def downsample(
+    df: pd.DataFrame, x, y, budget=POINT_BUDGET, method="minmax", window=None
+):
+    # Rows of df to plot: those with x inside window (a (start, end) pair),
+    # thinned to about budget points per column of y
+    if window is not None:
+        df = df[(df[x] >= window[0]) & (df[x] <= window[1])]
+    if len(df) <= budget:
+        return df
+
+    xs = df[x].to_numpy(dtype=float)
+    picks = []
+    for col in y:
+        ys = df[col].to_numpy(dtype=float)
+        if method == "lttb":
+            picks.append(lttb_indices(xs, ys, budget))
+        elif method == "minmax":
+            picks.append(minmax_indices(ys, budget))
+        else:
+            raise ValueError(f"Unknown downsampling method '{method}'")
+    return df.iloc[np.unique(np.concatenate(picks))]
+
+
+@st.experimental_memo(max_entries=64, show_spinner=False)
+def line_figure(
+    df: pd.DataFrame,
+    x,
+    y,
+    colors,
+    title="",
+    width=900,
+    height=350,
+    line_shape="linear",
+    value_label="MW",
+    window=None,
+    budget=POINT_BUDGET,
+):
+    import plotly.express as px
+
+    return (
+        px.line(
+            downsample(df, x, y, budget, window=window),
+            x=x,
+            y=y,
+            line_shape=line_shape,
+            color_discrete_sequence=colors,
+            width=width,
+            height=height,
+            labels={
+                "variable": "Legend",
+                "value": value_label,
+                "Solar": "MW",
+                "Price": "Hour",
+            },
+        )
+        .update_layout({"title_text": title, **BACKGROUND})
+        .update_xaxes(**GRID)
+        .update_yaxes(**GRID)
+    )
+
+
+@st.experimental_memo(max_entries=16, show_spinner=False)
+def average_figure(df: pd.DataFrame, x, y, color, title=""):
+    import plotly.express as px
+
+    return (
+        px.line(
+            df,
+            x=x,
+            y=y,
+            width=550,
+            height=300,
+            color_discrete_sequence=[color],
+            labels={
+                "variable": "Legend",
+                "value": "MW",
+                "Solar": "MW",
+                "Price": "Hour",
+            },
+        )
+        .update_layout({"title_text": f"Average Day - {title}", **BACKGROUND})
+        .update_xaxes(**GRID)
+        .update_yaxes(**GRID)
+        .update(layout_showlegend=False)
+    )
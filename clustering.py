@@ -0,0 +1,317 @@
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+import time
+
+from backends import get_backend
+from battery import BatteryParams
+from LP import solve_model
+from matrix_model import MatrixModel, build_model, time_step
+from stats import SolveStats
+
+# Representative-day reduction of long horizons.
+#
+# The days of the horizon are clustered by their Price/Solar/Wind shape and
+# only one real day per cluster (its medoid) is optimised, weighted by the
+# cluster size. Each representative day moves the SOC by delta[h] relative
+# to where the day started; the SOC at the start of every real day, S[d], is
+# kept as a variable so energy can still be carried between days:
+#   S[d + 1] = keep * S[d] + delta_r[23]     (r: representative of day d)
+#   soc_min <= S[d] + min_h delta_r[h]  and  S[d] + max_h delta_r[h] <= soc_max
+# where keep is what self-discharge leaves of S[d] after a day. With one
+# cluster per day and no self-discharge this is the same as the full model
+# (self-discharge only makes the SOC range checks approximate).
+
+HOURS = 24
+
+
+def _kmeans(X, k, rng, iterations=100):
+    # Lloyd's algorithm from a k-means++ start
+    centers = [X[rng.integers(len(X))]]
+    for _ in range(1, k):
+        d2 = np.min(((X[:, None] - np.array(centers)) ** 2).sum(-1), axis=1)
+        p = d2 / d2.sum() if d2.sum() > 0 else None
+        centers.append(X[rng.choice(len(X), p=p)])
+    centers = np.array(centers)
+
+    for _ in range(iterations):
+        labels = ((X[:, None] - centers) ** 2).sum(-1).argmin(axis=1)
+        new = np.array(
+            [
+                X[labels == j].mean(axis=0) if (labels == j).any() else c
+                for j, c in enumerate(centers)
+            ]
+        )
+        if np.allclose(new, centers):
+            break
+        centers = new
+    return labels, centers
+
+
+def cluster_days(
+    df: pd.DataFrame, k: int, columns=("Price", "Solar", "Wind"), seed=0
+):
+    # Returns (representatives, labels): the index of the real day standing
+    # in for each cluster, and each day's cluster. Columns are scaled by
+    # their standard deviation so that each counts equally.
+    n_days = df.shape[0] // HOURS
+    features = []
+    for col in columns:
+        values = df[col].to_numpy(dtype=float)[: n_days * HOURS]
+        scale = values.std() or 1.0
+        features.append(values.reshape(n_days, HOURS) / scale)
+    X = np.hstack(features)
+
+    k = min(k, n_days)
+    labels, centers = _kmeans(X, k, np.random.default_rng(seed))
+
+    # Keep only non-empty clusters, each represented by its medoid
+    representatives = []
+    for j in np.unique(labels):
+        members = np.flatnonzero(labels == j)
+        dist = ((X[members] - centers[j]) ** 2).sum(axis=1)
+        representatives.append(members[dist.argmin()])
+        labels[members] = len(representatives) - 1
+    return np.array(representatives), labels
+
+
+def build_clustered(
+    df: pd.DataFrame,
+    representatives,
+    labels,
+    solar_cap: int,
+    wind_cap: int,
+    battery_cap: int,
+    energy_cap: int,
+    grid_cap: int,
+    start_charge: int,
+    params=None,
+):
+    # Variables: the k representative day models (SOC relative to the start
+    # of the day), then delta_min (k), delta_max (k) and S (n_days + 1)
+    params = BatteryParams() if params is None else params
+    if params.dod_costs is not None:
+        raise ValueError(
+            "Representative days track the SOC relative to each day's "
+            "start, which depth-of-discharge segments cannot"
+        )
+    k, n_days = len(representatives), len(labels)
+    weights = np.bincount(labels, minlength=k).astype(float)
+    soc_min = params.soc_min * energy_cap
+    soc_max = params.soc_max * energy_cap
+    width = soc_max - soc_min
+    keep = (1 - params.self_discharge) ** HOURS
+    # The terminal target applies to S at the end of the horizon instead
+    day_params = params.replace(terminal_soc=None)
+
+    days = []
+    for r in representatives:
+        day = build_model(
+            df.iloc[r * HOURS : (r + 1) * HOURS],
+            solar_cap,
+            wind_cap,
+            battery_cap,
+            energy_cap,
+            grid_cap,
+            0,
+            params=day_params,
+        )
+        day.lb[day.block("soc")] = -width
+        day.ub[day.block("soc")] = width
+        days.append(day)
+    nv = days[0].n_vars
+    soc = days[0].block("soc")
+
+    n_days_vars = k * nv
+    i_min, i_max, i_s = n_days_vars, n_days_vars + k, n_days_vars + 2 * k
+    n = i_s + n_days + 1
+
+    def delta(r, h):
+        return r * nv + soc.start + h
+
+    # S[d + 1] - keep * S[d] - delta_r(d)[23] == 0
+    d = np.arange(n_days)
+    link = sp.csr_matrix(
+        (
+            np.tile([1.0, -keep, -1.0], n_days),
+            (
+                np.repeat(d, 3),
+                np.column_stack(
+                    [i_s + d + 1, i_s + d, delta(labels, HOURS - 1)]
+                ).ravel(),
+            ),
+        ),
+        shape=(n_days, n),
+    )
+    A_days = sp.block_diag([m.A_eq for m in days], format="csr")
+    A_eq = sp.vstack(
+        [
+            sp.hstack([A_days, sp.csr_matrix((A_days.shape[0], n - nv * k))]),
+            link,
+        ],
+        format="csr",
+    )
+    b_eq = np.concatenate(
+        [np.concatenate([m.b_eq for m in days]), np.zeros(n_days)]
+    )
+
+    # delta_r[h] <= delta_max_r, delta_min_r <= delta_r[h],
+    # -S[d] - delta_min_r(d) <= -soc_min, S[d] + delta_max_r(d) <= soc_max
+    r, h = np.divmod(np.arange(k * HOURS), HOURS)
+    rows = np.arange(k * HOURS)
+    ub_rows = [
+        (rows, delta(r, h), 1.0),
+        (rows, i_max + r, -1.0),
+        (rows + k * HOURS, i_min + r, 1.0),
+        (rows + k * HOURS, delta(r, h), -1.0),
+        (2 * k * HOURS + d, i_s + d, -1.0),
+        (2 * k * HOURS + d, i_min + labels, -1.0),
+        (2 * k * HOURS + n_days + d, i_s + d, 1.0),
+        (2 * k * HOURS + n_days + d, i_max + labels, 1.0),
+    ]
+    A_ub = sp.csr_matrix(
+        (
+            np.concatenate([np.full(len(i), v) for i, _, v in ub_rows]),
+            (
+                np.concatenate([i for i, _, _ in ub_rows]),
+                np.concatenate([j for _, j, _ in ub_rows]),
+            ),
+        ),
+        shape=(2 * k * HOURS + 2 * n_days, n),
+    )
+    b_ub = np.concatenate(
+        [
+            np.zeros(2 * k * HOURS),
+            np.full(n_days, -soc_min),
+            np.full(n_days, soc_max),
+        ]
+    )
+    # Each representative's daily cycle limit, ahead of the rows above
+    if params.max_daily_cycles is not None:
+        cycles = sp.block_diag([m.A_ub for m in days], format="csr")
+        cycles.resize((cycles.shape[0], n))
+        A_ub = sp.vstack([cycles, A_ub], format="csr")
+        b_ub = np.concatenate([*(m.b_ub for m in days), b_ub])
+
+    lb = np.concatenate(
+        [
+            *(m.lb for m in days),
+            np.full(k, -width),
+            np.zeros(k),
+            np.full(n_days + 1, soc_min),
+        ]
+    )
+    ub = np.concatenate(
+        [
+            *(m.ub for m in days),
+            np.zeros(k),
+            np.full(k, width),
+            np.full(n_days + 1, soc_max),
+        ]
+    )
+    lb[i_s] = ub[i_s] = start_charge
+    if params.terminal_soc is not None:
+        lb[-1] = params.terminal_soc * energy_cap
+
+    cost = np.concatenate(
+        [
+            np.concatenate([w * m.c for w, m in zip(weights, days)]),
+            np.zeros(n - k * nv),
+        ]
+    )
+    return (
+        MatrixModel(HOURS, cost, A_eq, b_eq, lb, ub, A_ub, b_ub),
+        days,
+        weights,
+    )
+
+
+def solve_clustered(
+    df: pd.DataFrame,
+    solar_cap: int,
+    wind_cap: int,
+    battery_cap: int,
+    energy_cap: int,
+    grid_cap: int,
+    start_charge: int,
+    k: int = 12,
+    reference=False,
+    seed=0,
+    backend="highs",
+    hooks=(),
+    return_stats=False,
+    params=None,
+):
+    # Approximate LP.solve_model with k representative days. df must cover
+    # whole days. The SOC/IMP/EXP added to (a copy of) df replay each day's
+    # representative. The stats counters hold the annualised revenue and,
+    # with reference=True, the error and speed-up against the full solve.
+    if time_step(df) != 1:
+        raise ValueError("Representative days need hourly steps")
+    if df.shape[0] % HOURS:
+        raise ValueError("Representative days need a whole number of days")
+
+    start = time.time()
+    stats = SolveStats(hooks)
+    with stats.phase("clustering"):
+        representatives, labels = cluster_days(df, k, seed=seed)
+    with stats.phase("build"):
+        model, days, weights = build_clustered(
+            df,
+            representatives,
+            labels,
+            solar_cap,
+            wind_cap,
+            battery_cap,
+            energy_cap,
+            grid_cap,
+            start_charge,
+            params,
+        )
+    with stats.phase("solve"):
+        solution = get_backend(backend).solve(model)
+    if solution.x is None:
+        raise RuntimeError(f"LP could not be solved: {solution.status}")
+
+    with stats.phase("extraction"):
+        df = df.copy()
+        nv = days[0].n_vars
+        x = solution.x[: len(days) * nv].reshape(len(days), nv)
+        start_soc = solution.x[len(days) * nv + 2 * len(days) :][:-1]
+        unpacked = days[0].unpack(x.T)
+        df["SOC"] = (unpacked["soc"][:, labels] + start_soc).T.ravel()
+        df["IMP"] = unpacked["grid_import"][:, labels].T.ravel()
+        df["EXP"] = unpacked["grid_export"][:, labels].T.ravel()
+        revenue = model.revenue(solution.x)
+
+    end = time.time()
+    solve_time = end - start
+    n_days = len(labels)
+    stats.count(
+        representative_days=len(days),
+        weights=weights.tolist(),
+        annualised_revenue=revenue * 365 / n_days,
+        status=solution.status,
+    )
+    if reference:
+        _, full, full_time = solve_model(
+            df,
+            solar_cap,
+            wind_cap,
+            battery_cap,
+            energy_cap,
+            grid_cap,
+            start_charge,
+            backend,
+            engine="lp",
+            params=params,
+        )
+        stats.count(
+            full_revenue=full,
+            error=(revenue - full) / abs(full) if full else 0.0,
+            speedup=full_time / solve_time,
+        )
+
+    if return_stats:
+        return (df, revenue, solve_time, stats)
+    return (df, revenue, solve_time)
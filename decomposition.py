@@ -0,0 +1,275 @@
+import contextlib
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+from battery import BatteryParams
+from jobs import worker_context
+from matrix_model import time_step
+from parametric import ParametricModel, default_backend
+from stats import SolveStats
+
+# Temporal decomposition of LP.solve_model for long horizons. The horizon is
+# split into blocks of whole days (about a month by default) that are
+# solved side by side in a process pool and only coupled through the SOC at
+# their boundaries. Every round, each block is solved from the SOC the
+# block before it ended on in the previous round, with the SOC it ends on
+# itself valued at a price of storage ($/MWh). Each price then moves, damped,
+# towards the marginal value of SOC at the start of the next block (the
+# dual of its first SOC row). The rounds stop once no boundary SOC changes
+# (or after max_iter), and a last pass solves each block between the fixed
+# boundary SOCs. That is a feasible dispatch of the whole horizon, so its
+# revenue is at most that of the monolithic LP.
+
+# Per-worker state, set by _init_worker. Each block's ParametricModel is
+# built on first use and kept, so with highspy it warm starts every round.
+_shared = None
+_models = {}
+
+
+def _init_worker(shared):
+    global _shared
+    _shared = shared
+    _models.clear()
+
+
+def _model(b):
+    if b not in _models:
+        t0, t1 = _shared["bounds"][b]
+        last = b == len(_shared["bounds"]) - 1
+        model = ParametricModel(
+            t1 - t0,
+            _shared["backend"],
+            _shared["params"] if last else _shared["inner_params"],
+            _shared["dt"],
+        )
+        model.set_capacities(**_shared["caps"])
+        profile = _shared["profile"]
+        model.set_profiles(profile["Solar"][t0:t1], profile["Wind"][t0:t1])
+        model.set_prices(profile["Price"][t0:t1])
+        _models[b] = model
+    return _models[b]
+
+
+def _solve_block(task):
+    # Solve block b from SOC start, crediting value per MWh of SOC at its
+    # end, with the end SOC fixed when end is given
+    b, start, value, end = task
+    model = _model(b)
+    model.set_start_charge(start)
+    model.set_end_value(value)
+    model.set_end_charge(end)
+
+    solution = model.solve()
+    if solution.x is None:
+        return {"block": b, "status": solution.status}
+    m = model.model
+    ans = m.unpack(solution.x)
+    soc_end = float(ans["soc"][-1])
+    keep = (1 - model.params.self_discharge) ** model.dt
+    return {
+        "block": b,
+        "status": solution.status,
+        "revenue": m.revenue(solution.x) - value * soc_end,
+        "soc_end": soc_end,
+        # Revenue of one more MWh at the start of the block
+        "marginal": (
+            None
+            if solution.duals is None
+            else -keep * float(solution.duals[m.row_block("soc").start])
+        ),
+        "soc": ans["soc"].copy(),
+        "grid_import": ans["grid_import"].copy(),
+        "grid_export": ans["grid_export"].copy(),
+        "discharge": ans["discharge"].copy(),
+    }
+
+
+@contextlib.contextmanager
+def _solver(shared, processes):
+    # A function solving a list of block tasks, in order
+    if processes == 1:
+        _init_worker(shared)
+        yield lambda tasks: [_solve_block(task) for task in tasks]
+        return
+
+    context = worker_context(backends=(shared["backend"],))
+    with context.Pool(processes, _init_worker, (shared,)) as pool:
+        yield lambda tasks: pool.map(_solve_block, tasks)
+
+
+def solve_decomposed(
+    df: pd.DataFrame,
+    solar_cap: int,
+    wind_cap: int,
+    battery_cap: int,
+    energy_cap: int,
+    grid_cap: int,
+    start_charge: int,
+    block_days: int = 30,
+    processes=None,
+    max_iter: int = 100,
+    tol: float = 1e-3,
+    damping: float = 0.5,
+    reference=False,
+    backend=None,
+    stats=None,
+    params=None,
+    dt=None,
+):
+    # Approximately LP.solve_model, with the results added to df. The
+    # rounds have converged once every price of storage still moving does
+    # so by at most tol times the mean price. The stats counters hold the
+    # number of rounds, whether they converged and, with reference=True,
+    # the gap to the monolithic revenue. backend None uses highspy when
+    # installed, which warm starts the blocks.
+    start_time = time.time()
+    stats = SolveStats() if stats is None else stats
+    params = BatteryParams() if params is None else params
+    dt = time_step(df, dt)
+    if params.dod_costs is not None:
+        raise ValueError(
+            "Decomposition couples blocks through a single SOC, which "
+            "depth-of-discharge costs split into segments"
+        )
+    if not 0 < damping < 1:
+        raise ValueError("damping must be in (0, 1)")
+
+    with stats.phase("data_prep"):
+        T = df.shape[0]
+        steps = block_days * max(round(24 / dt), 1)
+        bounds = [(t, min(t + steps, T)) for t in range(0, T, steps)]
+        B = len(bounds)
+        # Only the last block keeps the terminal SOC target
+        inner_params = params.replace(terminal_soc=None)
+        shared = {
+            "profile": {
+                col: df[col].to_numpy(dtype=float)
+                for col in ("Price", "Solar", "Wind")
+            },
+            "bounds": bounds,
+            "caps": {
+                "solar_cap": solar_cap,
+                "wind_cap": wind_cap,
+                "battery_cap": battery_cap,
+                "energy_cap": energy_cap,
+                "grid_cap": grid_cap,
+            },
+            "params": params,
+            "inner_params": inner_params,
+            "dt": dt,
+            "backend": backend or default_backend(),
+        }
+        processes = min(processes or os.cpu_count(), B)
+
+    def check(results):
+        for r in results:
+            if "soc" not in r:
+                t0, t1 = bounds[r["block"]]
+                raise RuntimeError(
+                    f"LP could not be solved for steps {t0}-{t1}: "
+                    f"{r['status']}"
+                )
+        return results
+
+    # starts[0] is the given start_charge and values[-1] stays 0, as SOC
+    # left at the end of the horizon is worth nothing. Each boundary's price
+    # moves by its own step towards the next block's marginal value, and
+    # the step shrinks by damping whenever it overshoots.
+    starts = np.full(B, float(start_charge))
+    values = np.zeros(B)
+    price_scale = max(np.abs(shared["profile"]["Price"]).mean(), 1e-9)
+    steps = np.full(B - 1, price_scale)
+    moves = np.zeros(B - 1)
+    iterations, mismatch, converged = 0, 0.0, B == 1
+    with _solver(shared, processes) as solve:
+        with stats.phase("coordination"):
+            while not converged and iterations < max_iter:
+                results = check(
+                    solve([(b, starts[b], values[b], None) for b in range(B)])
+                )
+                iterations += 1
+                if results[0]["marginal"] is None:
+                    raise ValueError(
+                        f"Backend '{shared['backend']}' gives no duals to "
+                        "coordinate the blocks with"
+                    )
+                ends = np.array([r["soc_end"] for r in results])
+                marginals = np.array([r["marginal"] for r in results])
+                gaps = np.abs(ends[:-1] - starts[1:])
+                mismatch = gaps.max() / energy_cap if energy_cap else 0.0
+                starts[1:] = ends[:-1]
+                if iterations == 1:
+                    values[:-1] = marginals[1:]
+                    continue
+
+                direction = np.sign(marginals[1:] - values[:-1])
+                steps[direction * moves < 0] *= damping
+                moves = direction
+                converged = bool(
+                    (steps[direction != 0] <= tol * price_scale).all()
+                )
+                values[:-1] += steps * direction
+
+        with stats.phase("solve"):
+            results = check(
+                solve(
+                    [
+                        (
+                            b,
+                            starts[b],
+                            0.0,
+                            starts[b + 1] if b < B - 1 else None,
+                        )
+                        for b in range(B)
+                    ]
+                )
+            )
+
+    with stats.phase("extraction"):
+        for name, column in (
+            ("soc", "SOC"),
+            ("grid_import", "IMP"),
+            ("grid_export", "EXP"),
+        ):
+            df[column] = np.concatenate([r[name] for r in results])
+        revenue = sum(r["revenue"] for r in results)
+        discharge = np.concatenate([r["discharge"] for r in results])
+    stats.count(
+        engine="decomposed",
+        backend=shared["backend"],
+        status="Optimal",
+        blocks=B,
+        processes=processes,
+        iterations=iterations,
+        converged=converged,
+        boundary_mismatch=mismatch,
+        equivalent_cycles=params.equivalent_cycles(discharge, energy_cap, dt),
+    )
+
+    end = time.time()
+    solve_time = end - start_time
+    if reference:
+        from LP import solve_model
+
+        _, full, full_time = solve_model(
+            df.copy(),
+            solar_cap,
+            wind_cap,
+            battery_cap,
+            energy_cap,
+            grid_cap,
+            start_charge,
+            shared["backend"],
+            engine="lp",
+            params=params,
+            dt=dt,
+        )
+        stats.count(
+            full_revenue=full,
+            gap=(full - revenue) / abs(full) if full else 0.0,
+            speedup=full_time / solve_time,
+        )
+    return (df, revenue, solve_time)
@@ -0,0 +1,221 @@
+import importlib
+import itertools
+import multiprocessing as mp
+import os
+import queue
+import signal
+import threading
+import time
+import traceback
+from collections import deque
+
+from stats import SolveStats
+
+# Background solves. Every job runs in its own process so that cancelling
+# it really stops the solver (including a CBC subprocess), and reports the
+# phases it finishes through a queue. target is called as
+# target(*args, hooks=..., **kwargs), so LP.solve_model,
+# cache.cached_solve_model and clustering.solve_clustered can all be run
+# as jobs. One JobManager is meant to be shared by every dashboard session.
+
+FINISHED = ("done", "failed", "cancelled")
+
+# Imported once by the parent of the solver processes, so that workers start
+# with them loaded
+PRELOAD = ("numpy", "pandas", "scipy.sparse", "LP")
+
+
+def worker_context(method=None, backends=("highs",)):
+    # Multiprocessing context whose workers start warm. With "fork" (the
+    # default on Linux) PRELOAD and the backends' solver modules are
+    # imported here before forking; with "forkserver" the server imports
+    # them once and forks every worker from itself, which is also safe for
+    # multi-threaded parents such as Streamlit. "spawn" workers import
+    # everything themselves.
+    from backends import get_backend
+
+    context = mp.get_context(method)
+    modules = [
+        *PRELOAD,
+        *(name for b in backends for name in get_backend(b).modules),
+    ]
+    if context.get_start_method() == "fork":
+        for name in modules:
+            try:
+                importlib.import_module(name)
+            except ImportError:
+                pass
+    elif context.get_start_method() == "forkserver":
+        context.set_forkserver_preload(modules)
+    return context
+
+
+def _resolve(target):
+    # A "module:function" target is only imported by the worker, so the
+    # submitting process never has to import the solver
+    if isinstance(target, str):
+        module, _, name = target.partition(":")
+        return getattr(importlib.import_module(module), name)
+    return target
+
+
+class _Progress:
+    # SolveStats hook that forwards each finished phase to the parent
+    def __init__(self, channel):
+        self.channel = channel
+
+    def __call__(self, name, seconds, stats):
+        self.channel.put(("phase", (name, seconds)))
+
+
+def _run(channel, target, args, kwargs):
+    # Own process group, so the solver's children are cancelled with it
+    if hasattr(os, "setsid"):
+        os.setsid()
+    try:
+        target = _resolve(target)
+        result = target(*args, hooks=(_Progress(channel),), **kwargs)
+    except Exception as e:
+        channel.put(("error", traceback.format_exception_only(type(e), e)))
+    else:
+        # The hook holds the queue, which cannot be sent back
+        for item in result if isinstance(result, tuple) else (result,):
+            if isinstance(item, SolveStats):
+                item.hooks = []
+        channel.put(("done", result))
+
+
+class Job:
+    def __init__(self, job_id, target, args, kwargs):
+        self.id = job_id
+        self.target = target
+        self.args = args
+        self.kwargs = kwargs
+        self.status = "queued"
+        self.phases = []
+        self.result = None
+        self.error = None
+        self.submitted = time.time()
+        self.started = None
+        self.finished = None
+        self._process = None
+        self._channel = None
+
+    @property
+    def done(self):
+        return self.status in FINISHED
+
+    @property
+    def elapsed(self):
+        if self.started is None:
+            return 0.0
+        return (self.finished or time.time()) - self.started
+
+
+class JobManager:
+    # Runs at most max_workers jobs at once; further jobs wait in submission
+    # order. Job state is only updated by poll(), which get() calls. Workers
+    # come from a preloaded forkserver where the platform has one.
+    def __init__(self, max_workers=None, context=None):
+        if context is None and "forkserver" in mp.get_all_start_methods():
+            context = "forkserver"
+        self.max_workers = max_workers or os.cpu_count()
+        self._context = worker_context(context)
+        self._jobs = {}
+        self._pending = deque()
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def submit(self, target, *args, **kwargs):
+        with self._lock:
+            job = Job(next(self._ids), target, args, kwargs)
+            self._jobs[job.id] = job
+            self._pending.append(job)
+        self.poll()
+        return job.id
+
+    def get(self, job_id):
+        self.poll()
+        return self._jobs.get(job_id)
+
+    def cancel(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job.done:
+                return
+            if job.status == "queued":
+                self._pending.remove(job)
+            else:
+                self._kill(job._process)
+                job._process.join()
+            job.status = "cancelled"
+            job.finished = time.time()
+        self.poll()
+
+    def discard(self, job_id):
+        # Forget a job, cancelling it if it has not finished
+        self.cancel(job_id)
+        with self._lock:
+            self._jobs.pop(job_id, None)
+
+    def running(self):
+        return [j for j in self._jobs.values() if j.status == "running"]
+
+    def poll(self):
+        with self._lock:
+            for job in self.running():
+                self._update(job)
+            while self._pending and len(self.running()) < self.max_workers:
+                self._start(self._pending.popleft())
+
+    def shutdown(self):
+        for job_id in list(self._jobs):
+            self.cancel(job_id)
+
+    def _start(self, job):
+        job._channel = self._context.Queue()
+        job._process = self._context.Process(
+            target=_run,
+            args=(job._channel, job.target, job.args, job.kwargs),
+            daemon=True,
+        )
+        job._process.start()
+        job.status = "running"
+        job.started = time.time()
+
+    def _update(self, job):
+        # Check liveness first: a process that has exited has already
+        # flushed everything it put on the queue
+        alive = job._process.is_alive()
+        while True:
+            try:
+                kind, payload = job._channel.get_nowait()
+            except queue.Empty:
+                break
+            if kind == "phase":
+                job.phases.append(payload)
+            elif kind == "done":
+                job.status, job.result = "done", payload
+            else:
+                job.status, job.error = "failed", "".join(payload).strip()
+
+        if job.status == "running" and not alive:
+            job.status = "failed"
+            job.error = (
+                f"Worker exited without a result "
+                f"(exit code {job._process.exitcode})"
+            )
+        if job.done:
+            job.finished = time.time()
+            job._process.join()
+            job._channel.close()
+
+    @staticmethod
+    def _kill(process):
+        if hasattr(os, "killpg"):
+            try:
+                os.killpg(process.pid, signal.SIGKILL)
+                return
+            except OSError:
+                pass
+        process.kill()
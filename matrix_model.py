@@ -0,0 +1,314 @@
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+
+from battery import BatteryParams
+from stats import SolveStats
+
+# Each variable family occupies a contiguous block of T entries in the
+# decision vector, in this order
+VARIABLES = (
+    "solar",
+    "wind",
+    "charge",
+    "discharge",
+    "grid_export",
+    "grid_import",
+    "soc",
+)
+
+# Equality rows are stacked the same way: T energy balance rows, then T SOC
+# recursion rows
+ROWS = ("balance", "soc")
+
+# With depth-of-discharge costs (BatteryParams.dod_costs) the stored energy
+# is also split into K equal segments, from the top of the battery down,
+# each with its own charge, discharge and SOC. These follow the blocks
+# above, K * T entries per family, segment by segment
+SEGMENT_VARIABLES = ("segment_charge", "segment_discharge", "segment_soc")
+
+# Their rows come after ROWS: charge == sum of the segment charges (T rows),
+# the same for discharge (T rows), then the K * T segment SOC recursions
+SEGMENT_ROWS = ("charge_split", "discharge_split", "segment_soc")
+
+
+class MatrixModel:
+    # The LP of LP.solve_model written as
+    #   min c @ x  s.t.  A_eq @ x == b_eq,  A_ub @ x <= b_ub,  lb <= x <= ub
+    # The objective is negated revenue, so revenue == -(c @ x). segments is
+    # the number of depth-of-discharge segments (0 without) and dt the
+    # length of a time step in hours.
+    def __init__(
+        self,
+        T,
+        c,
+        A_eq,
+        b_eq,
+        lb,
+        ub,
+        A_ub=None,
+        b_ub=None,
+        segments=0,
+        dt=1.0,
+    ):
+        self.T = T
+        self.c = c
+        self.A_eq = A_eq
+        self.b_eq = b_eq
+        self.lb = lb
+        self.ub = ub
+        self.A_ub = A_ub
+        self.b_ub = b_ub
+        self.segments = segments
+        self.dt = dt
+
+    @property
+    def n_vars(self):
+        return self.c.shape[0]
+
+    def block(self, name):
+        if name in VARIABLES:
+            i = VARIABLES.index(name)
+            return slice(i * self.T, (i + 1) * self.T)
+        size = self.segments * self.T
+        start = len(VARIABLES) * self.T + SEGMENT_VARIABLES.index(name) * size
+        return slice(start, start + size)
+
+    def row_block(self, name):
+        if name in ROWS:
+            i = ROWS.index(name)
+            return slice(i * self.T, (i + 1) * self.T)
+        i = SEGMENT_ROWS.index(name)
+        start = (len(ROWS) + i) * self.T
+        return slice(start, start + (self.segments if i == 2 else 1) * self.T)
+
+    def unpack(self, x):
+        # Views into x, one per variable family
+        return {name: x[self.block(name)] for name in VARIABLES}
+
+    def revenue(self, x):
+        return -(self.c @ x)
+
+
+def time_step(df: pd.DataFrame, dt=None):
+    # Hours per row of df: dt when given, else df.attrs["dt"] (set by
+    # profiles.load_profile and profiles.resample), else one hour
+    dt = df.attrs.get("dt", 1.0) if dt is None else dt
+    if dt <= 0:
+        raise ValueError("The time step must be positive")
+    return float(dt)
+
+
+def segment_fill(start_charge, energy_cap, segments):
+    # Start charge of each depth-of-discharge segment (top first), with
+    # the deepest segments filled first
+    width = energy_cap / segments
+    below = np.arange(segments)[::-1]
+    return np.clip(start_charge - below * width, 0, width)
+
+
+def build_model(
+    df: pd.DataFrame,
+    solar_cap: int,
+    wind_cap: int,
+    battery_cap: int,
+    energy_cap: int,
+    grid_cap: int,
+    start_charge: int,
+    stats=None,
+    params=None,
+    dt=None,
+):
+    # params is a BatteryParams, by default the values in constants.py.
+    # Each row of df lasts dt hours (see time_step): capacities are in MW,
+    # energy in MWh and prices in $/MWh, so power is scaled by dt wherever
+    # it becomes energy or money.
+    stats = SolveStats() if stats is None else stats
+    params = BatteryParams() if params is None else params
+    dt = time_step(df, dt)
+
+    with stats.phase("data_prep"):
+        T = df.shape[0]
+        price = df["Price"].to_numpy(dtype=float)
+        solar = df["Solar"].to_numpy(dtype=float)
+        wind = df["Wind"].to_numpy(dtype=float)
+        zeros = np.zeros(T)
+
+    with stats.phase("variables"):
+        # VRE availability is folded into the upper bounds of solar/wind
+        lb = np.zeros(len(VARIABLES) * T)
+        ub = np.concatenate(
+            [
+                np.minimum(solar, solar_cap),
+                np.minimum(wind, wind_cap),
+                np.full(T, float(battery_cap)),
+                np.full(T, float(battery_cap)),
+                np.full(T, float(grid_cap)),
+                np.full(T, float(grid_cap)),
+                np.full(T, params.soc_max * energy_cap),
+            ]
+        )
+        # soc is the last block
+        lb[-T:] = params.soc_min * energy_cap
+        if params.terminal_soc is not None:
+            lb[-1] = params.terminal_soc * energy_cap
+        # Degradation is charged on the energy leaving the battery
+        wear = np.full(T, dt * params.throughput_cost / params.discharge_eff)
+        cost = np.concatenate(
+            [zeros, zeros, zeros, wear, -dt * price, dt * price, zeros]
+        )
+
+    with stats.phase("constraints"):
+        eye = sp.identity(T, format="csr")
+        inverter_eff = params.inverter_eff
+        keep = (1 - params.self_discharge) ** dt
+        # solar + wind + discharge - charge == exp / inv_eff - imp * inv_eff
+        balance = [
+            eye,
+            eye,
+            -eye,
+            eye,
+            -(1 / inverter_eff) * eye,
+            inverter_eff * eye,
+            None,
+        ]
+        # soc[t] - keep * soc[t - 1] - dt * charge * charge_eff
+        #     + dt * discharge / discharge_eff == 0
+        soc = [
+            None,
+            None,
+            -dt * params.charge_eff * eye,
+            (dt / params.discharge_eff) * eye,
+            None,
+            None,
+            eye - keep * sp.eye(T, k=-1, format="csr"),
+        ]
+        A_eq = sp.bmat([balance, soc], format="csr")
+
+        b_eq = np.zeros(2 * T)
+        b_eq[T] = keep * start_charge
+
+        K = 0
+        if params.dod_costs is not None:
+            K = len(params.dod_costs)
+            A_eq, b_eq, lb, ub, cost = _add_segments(
+                A_eq,
+                b_eq,
+                lb,
+                ub,
+                cost,
+                T,
+                K,
+                battery_cap,
+                energy_cap,
+                start_charge,
+                params,
+                dt,
+            )
+
+        # Energy taken out of the battery each day <= cycles * energy_cap
+        A_ub = b_ub = None
+        if params.max_daily_cycles is not None:
+            steps_per_day = max(round(24 / dt), 1)
+            n_days = -(-T // steps_per_day)
+            t = np.arange(T)
+            A_ub = sp.csr_matrix(
+                (
+                    np.full(T, dt / params.discharge_eff),
+                    (
+                        t // steps_per_day,
+                        VARIABLES.index("discharge") * T + t,
+                    ),
+                ),
+                shape=(n_days, len(lb)),
+            )
+            b_ub = np.full(n_days, params.max_daily_cycles * energy_cap)
+
+    stats.count(
+        variables=len(lb),
+        constraints=len(b_eq) + (0 if b_ub is None else len(b_ub)),
+        nonzeros=A_eq.nnz + (0 if A_ub is None else A_ub.nnz),
+    )
+    return MatrixModel(T, cost, A_eq, b_eq, lb, ub, A_ub, b_ub, K, dt)
+
+
+def _add_segments(
+    A_eq,
+    b_eq,
+    lb,
+    ub,
+    cost,
+    T,
+    K,
+    battery_cap,
+    energy_cap,
+    start_charge,
+    params,
+    dt,
+):
+    # Append the segment columns and rows (see SEGMENT_VARIABLES). Summed
+    # over the segments their SOC recursions give the main one, so the SOC
+    # always equals the total of the segment SOCs.
+    keep = (1 - params.self_discharge) ** dt
+    eye = sp.identity(T, format="csr")
+    eye_k = sp.identity(K, format="csr")
+    split = sp.kron(np.ones((1, K)), eye, format="csr")
+
+    def pick(name):
+        # Selects the T entries of a main variable family
+        t = np.arange(T)
+        return sp.csr_matrix(
+            (np.ones(T), (t, VARIABLES.index(name) * T + t)),
+            shape=(T, A_eq.shape[1]),
+        )
+
+    A_eq = sp.bmat(
+        [
+            [A_eq, None, None, None],
+            [pick("charge"), -split, None, None],
+            [pick("discharge"), None, -split, None],
+            [
+                None,
+                sp.kron(eye_k, -dt * params.charge_eff * eye),
+                sp.kron(eye_k, (dt / params.discharge_eff) * eye),
+                sp.kron(eye_k, eye - keep * sp.eye(T, k=-1, format="csr")),
+            ],
+        ],
+        format="csr",
+    )
+
+    segment_b = np.zeros((K, T))
+    segment_b[:, 0] = keep * segment_fill(start_charge, energy_cap, K)
+    b_eq = np.concatenate([b_eq, np.zeros(2 * T), segment_b.ravel()])
+
+    lb = np.concatenate([lb, np.zeros(3 * K * T)])
+    ub = np.concatenate(
+        [
+            ub,
+            np.full(2 * K * T, float(battery_cap)),
+            np.full(K * T, energy_cap / K),
+        ]
+    )
+    costs = (
+        dt * np.asarray(params.dod_costs, dtype=float) / params.discharge_eff
+    )
+    cost = np.concatenate(
+        [cost, np.zeros(K * T), np.repeat(costs, T), np.zeros(K * T)]
+    )
+    return A_eq, b_eq, lb, ub, cost
+
+
+def attach_solution(df: pd.DataFrame, model: MatrixModel, solution):
+    # Write the solved SOC/IMP/EXP columns (and the duals, when the backend
+    # gives them) onto df straight from the solution arrays, and return the
+    # revenue. BAL_DUAL is the value of one more MWh at the battery bus and
+    # SOC_DUAL the value of one more MWh held in the battery, both in $/MWh.
+    ans = model.unpack(solution.x)
+    df["SOC"] = ans["soc"]
+    df["IMP"] = ans["grid_import"]
+    df["EXP"] = ans["grid_export"]
+    if solution.duals is not None:
+        # The balance rows are in MW, i.e. per dt hours of energy
+        df["BAL_DUAL"] = solution.duals[model.row_block("balance")] / model.dt
+        df["SOC_DUAL"] = -solution.duals[model.row_block("soc")]
+    return model.revenue(solution.x)
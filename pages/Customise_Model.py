@@ -1,72 +1,89 @@
 # To launch dashboard, in terminal -> streamlit run streamlit_app.py
+import time
+
+import numpy as np
 import streamlit as st
 import pandas as pd
-import plotly.express as px
-from LP import solve_model
+from charts import (
+    POINT_BUDGET,
+    average_figure,
+    hourly_averages,
+    line_figure,
+)
+from jobs import JobManager
+from profiles import load_profile
+from results import DispatchResult
+from stats import SolveStats
 
 
-def make_line_chart(df_arg, x_arg, y_arg, cols, title=""):
-    st.plotly_chart(
-        px.line(
-            df_arg,
-            x=x_arg,
-            y=y_arg,
-            color_discrete_sequence=cols,
-            width=900,
-            height=350,
-            labels={
-                "variable": "Legend",
-                "value": "MW",
-                "Solar": "MW",
-                "Price": "Hour",
-            },
-        )
-        .update_layout(
-            {
-                "title_text": title,
-                "plot_bgcolor": "#0E1116",
-                "paper_bgcolor": "#0E1116",
-            }
+@st.experimental_singleton
+def job_manager():
+    # Shared by every session, so concurrent users queue for the same
+    # worker processes instead of blocking each other's scripts
+    return JobManager()
+
+
+def show_progress(manager, job):
+    st.info(f"Solving... {job.elapsed:.1f} s elapsed ({job.status})")
+    if job.phases:
+        st.table(
+            pd.DataFrame(job.phases, columns=["Finished phase", "Time (s)"])
         )
-        .update_xaxes(linecolor="#27292E", gridcolor="#27292E")
-        .update_yaxes(linecolor="#27292E", gridcolor="#27292E")
+    if st.button("Cancel"):
+        manager.cancel(job.id)
+        st.experimental_rerun()
+    time.sleep(0.5)
+    st.experimental_rerun()
+
+
+def cached_result(df, *args):
+    # The result cache of this server process, shared by every session: a
+    # configuration solved before is shown without starting a job. Jobs run
+    # in their own processes, so their results are stored here when they
+    # finish (see store_result).
+    from cache import CACHE, RESULT_COLUMNS, cache_key
+
+    start = time.time()
+    key = cache_key(df, *args)
+    hit = CACHE.get(key)
+    if hit is None:
+        return key, None
+    df = df.copy()
+    for col in RESULT_COLUMNS:
+        df[col] = hit[col]
+    stats = SolveStats()
+    stats.count(cache_hit=True)
+    result = DispatchResult.from_frame(
+        df, float(hit["revenue"]), time.time() - start, stats
     )
+    return key, result
 
 
-def make_avg_chart(df_arg, x_arg, y_arg, color, title=""):
+def store_result(key, df, revenue):
+    from cache import CACHE, RESULT_COLUMNS
+
+    hit = {col: df[col].to_numpy() for col in RESULT_COLUMNS}
+    hit["revenue"] = np.array(revenue)
+    CACHE.put(key, hit)
+
+
+def make_line_chart(df_arg, x_arg, y_arg, cols, title="", window=None):
     st.plotly_chart(
-        px.line(
-            df_arg,
-            x=x_arg,
-            y=y_arg,
-            width=550,
-            height=300,
-            color_discrete_sequence=[color],
-            labels={
-                "variable": "Legend",
-                "value": "MW",
-                "Solar": "MW",
-                "Price": "Hour",
-            },
+        line_figure(
+            df_arg[[x_arg, *y_arg]], x_arg, y_arg, cols, title, window=window
         )
-        .update_layout(
-            {
-                "title_text": f"Average Day - {title}",
-                "plot_bgcolor": "#0E1116",
-                "paper_bgcolor": "#0E1116",
-            }
-        )
-        .update_xaxes(linecolor="#27292E", gridcolor="#27292E")
-        .update_yaxes(linecolor="#27292E", gridcolor="#27292E")
-        .update(layout_showlegend=False)
     )
 
 
+def make_avg_chart(df_arg, x_arg, y_arg, color, title=""):
+    st.plotly_chart(average_figure(df_arg, x_arg, y_arg, color, title))
+
+
 def cli():
     st.set_page_config(layout="wide")
 
     # Reading in / manipulating data
-    df = pd.read_csv("8760_data.csv")
+    df = load_profile("8760_data.csv")
     header = st.container()
 
     with header:
@@ -108,6 +125,20 @@ def cli():
             )
             sim_length = sim_length_days * 24
 
+            # Long runs can be approximated by a few representative days
+            approximate = st.checkbox(
+                "Approximate with representative days ⏩",
+                value=False,
+                disabled=sim_length_days < 14,
+            )
+            n_representative = st.slider(
+                "Representative days",
+                min_value=2,
+                max_value=48,
+                value=12,
+                disabled=not approximate,
+            )
+
         with col2:
             energy_cap = st.number_input(
                 "Battery Size 🔋(MWh)", 10, 100, value=40, step=10
@@ -129,24 +160,9 @@ def cli():
         df["Wind"] = df["Wind"] * wind_cap
         df["Solar"] = df["Solar"] * solar_cap
 
-        avgs = []
-        Hours = df.Hour.unique()
-        df_avg = df.head(sim_length)
-
-        for hour in Hours:
-            avgs.append(
-                {
-                    "Hour": hour,
-                    "Avg. Solar": df_avg.loc[
-                        df_avg["Hour"] == hour, "Solar"
-                    ].mean(),
-                    "Avg. Wind": df_avg.loc[
-                        df_avg["Hour"] == hour, "Wind"
-                    ].mean(),
-                }
-            )
-
-        avgs = pd.DataFrame(avgs)
+        avgs = hourly_averages(
+            df.head(sim_length), {"Solar": "Avg. Solar", "Wind": "Avg. Wind"}
+        )
 
         col1, col2 = st.columns(2)
         with col1:
@@ -165,36 +181,103 @@ def cli():
 
     results = st.container()
     with results:
+        manager = job_manager()
         if st.button("Solve Model"):
-            df_ans, tot, solve_time = solve_model(
-                df.head(sim_length),
-                solar_cap,
-                wind_cap,
-                battery_cap,
-                energy_cap,
-                grid_cap,
-                start_charge,
+            st.session_state.pop("result", None)
+            st.session_state.pop("cache_key", None)
+            previous = st.session_state.pop("job", None)
+            if previous is not None:
+                manager.discard(previous)
+            if approximate and sim_length_days >= 14:
+                st.session_state["job"] = manager.submit(
+                    "clustering:solve_clustered",
+                    df.head(sim_length),
+                    solar_cap,
+                    wind_cap,
+                    battery_cap,
+                    energy_cap,
+                    grid_cap,
+                    start_charge,
+                    k=n_representative,
+                    return_stats=True,
+                )
+            else:
+                args = (
+                    df.head(sim_length),
+                    solar_cap,
+                    wind_cap,
+                    battery_cap,
+                    energy_cap,
+                    grid_cap,
+                    start_charge,
+                )
+                key, result = cached_result(*args)
+                if result is not None:
+                    st.session_state["result"] = result
+                else:
+                    st.session_state["cache_key"] = key
+                    st.session_state["job"] = manager.submit(
+                        "LP:solve_model", *args, return_stats=True
+                    )
+
+        job_id = st.session_state.get("job")
+        job = None if job_id is None else manager.get(job_id)
+        if job is not None and not job.done:
+            show_progress(manager, job)
+        elif job is not None:
+            st.session_state.pop("job")
+            manager.discard(job_id)
+            key = st.session_state.pop("cache_key", None)
+            if job.status == "done" and key is not None:
+                store_result(key, job.result[0], job.result[1])
+            if job.status == "done":
+                # Kept per session, so only as float32 arrays
+                st.session_state["result"] = DispatchResult.from_frame(
+                    *job.result
+                )
+            elif job.status == "failed":
+                st.error(f"Solve failed: {job.error}")
+            else:
+                st.warning("Solve cancelled")
+
+        if "result" in st.session_state:
+            result = st.session_state["result"]
+            tot, solve_time, stats = (
+                result.revenue,
+                result.solve_time,
+                result.stats,
             )
-            df_ans["Solar (MW)"] = df_ans["Solar"]
-            df_ans["Wind (MW)"] = df_ans["Wind"]
-            df_ans["Price ($/MWh)"] = df_ans["Price"]
-            df_ans["SOC (MWh)"] = df_ans["SOC"]
-            df_ans["Import (MW)"] = df_ans["IMP"]
-            df_ans["Export (MW)"] = df_ans["EXP"]
+            if "representative_days" in stats.counters:
+                st.info(
+                    f"Approximated with {stats.counters['representative_days']} representative days - SOC, import and export replay each day's representative."
+                )
+            # Long results are thinned to POINT_BUDGET points per series;
+            # zooming in on a window brings back the hourly detail
+            window = None
+            if len(result) > POINT_BUDGET:
+                first, last = int(result["T"][0]), int(result["T"][-1])
+                window = st.slider(
+                    "Zoom (hours)",
+                    min_value=first,
+                    max_value=last,
+                    value=(first, last),
+                )
 
             make_line_chart(
-                df_ans,
+                result.frame(["T", "Price ($/MWh)", "SOC (MWh)"]),
                 "T",
                 ["Price ($/MWh)", "SOC (MWh)"],
                 ["skyblue", "green"],
                 "Optimal Solution - Price and SOC through time",
+                window,
             )
             make_line_chart(
-                df_ans,
+                result.frame(["T", "Import (MW)", "Export (MW)"]),
                 "T",
                 ["Import (MW)", "Export (MW)"],
                 ["red", "blue"],
                 "Optimal Solution - Import/Export through time",
+                window,
             )
             col1, col2, col3 = st.columns(3)
             with col1:
@@ -211,6 +294,13 @@ def cli():
                     value=f"${round(tot/sim_length_days)}",
                 )
 
+            with st.expander("Solve time breakdown"):
+                col1, col2 = st.columns(2)
+                with col1:
+                    st.dataframe(stats.to_frame())
+                with col2:
+                    st.json(stats.counters)
+
 
 if __name__ == "__main__":
     cli()
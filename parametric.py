@@ -0,0 +1,287 @@
+import logging
+import numpy as np
+import pandas as pd
+import time
+
+from backends import HighspyBackend, get_backend
+from battery import BatteryParams
+from matrix_model import (
+    attach_solution,
+    build_model,
+    segment_fill,
+    time_step,
+)
+from stats import SolveStats
+
+logger = logging.getLogger(__name__)
+
+
+def default_backend():
+    # highspy when installed, as only it can warm start
+    try:
+        import highspy  # noqa: F401
+
+        return "highspy"
+    except ImportError:
+        return "highs"
+
+
+class ParametricModel:
+    # The model structure for a horizon of T steps, built once. Capacities,
+    # VRE availability, start charge and prices are changed with the set_*
+    # methods and the model re-solved. With highspy installed the same Highs
+    # instance is kept between solves, so each re-solve warm starts from the
+    # previous basis; otherwise the stored matrices are re-solved from
+    # scratch by the given backend. params (a BatteryParams) set the
+    # battery physics; changing them with set_params rebuilds the model.
+    # Each step lasts dt hours.
+    def __init__(self, T: int, backend=None, params=None, dt=1.0):
+        self.T = T
+        self.dt = dt
+        self.params = BatteryParams() if params is None else params
+        self.model = self._build()
+        self.solar = np.zeros(T)
+        self.wind = np.zeros(T)
+        self.price = np.zeros(T)
+        self.start_charge = 0
+        self.end_value = 0.0
+        self.end_charge = None
+        self.caps = dict.fromkeys(
+            ("solar_cap", "wind_cap", "battery_cap", "energy_cap", "grid_cap"),
+            0,
+        )
+
+        if backend is None:
+            backend = default_backend()
+        self.backend = get_backend(backend)
+        self._highs = None
+        self._dirty_cols = set()
+        self._dirty_cost = False
+        self._dirty_start = False
+        self._dirty_rows = False
+
+    def _build(self):
+        zeros = pd.DataFrame(
+            {"Solar": 0.0, "Wind": 0.0, "Price": 0.0}, range(self.T)
+        )
+        return build_model(
+            zeros, 0, 0, 0, 0, 0, 0, params=self.params, dt=self.dt
+        )
+
+    @property
+    def warm(self):
+        return isinstance(self.backend, HighspyBackend)
+
+    def set_params(self, params):
+        # The next solve starts cold, from the rebuilt model. Its objective
+        # holds the new wear costs, so only the prices and end value are
+        # set again.
+        self.params = params
+        self.model = self._build()
+        self._highs = None
+        self.set_prices(self.price)
+        self.set_end_value(self.end_value)
+        self._update_bounds()
+
+    def set_capacities(self, **caps):
+        unknown = set(caps) - set(self.caps)
+        if unknown:
+            raise ValueError(f"Unknown capacities {sorted(unknown)}")
+        self.caps.update(caps)
+        self._update_bounds()
+
+    def set_profiles(self, solar=None, wind=None):
+        # Available solar/wind power (MW) at each step
+        if solar is not None:
+            self.solar = np.asarray(solar, dtype=float)
+        if wind is not None:
+            self.wind = np.asarray(wind, dtype=float)
+        self._update_bounds()
+
+    def set_prices(self, price):
+        self.price = np.asarray(price, dtype=float)
+        price = self.dt * self.price
+        self.model.c[self.model.block("grid_export")] = -price
+        self.model.c[self.model.block("grid_import")] = price
+        self._dirty_cost = True
+
+    def set_start_charge(self, start_charge):
+        self.start_charge = start_charge
+        self._update_start()
+
+    def set_end_value(self, value):
+        # Revenue ($/MWh) credited for the SOC left after the last step
+        self.end_value = value
+        self.model.c[self.model.block("soc").stop - 1] = -value
+        self._dirty_cost = True
+
+    def set_end_charge(self, end_charge):
+        # Fix the SOC after the last step, or free it again with None
+        self.end_charge = end_charge
+        self._update_bounds()
+
+    def _start_rows(self):
+        # The first row of the SOC recursion and of each segment's
+        m = self.model
+        rows = [m.row_block("soc").start]
+        if m.segments:
+            segment_rows = m.row_block("segment_soc")
+            rows += range(segment_rows.start, segment_rows.stop, self.T)
+        return rows
+
+    def _update_start(self):
+        m = self.model
+        start = [self.start_charge]
+        if m.segments:
+            start += list(
+                segment_fill(
+                    self.start_charge, self.caps["energy_cap"], m.segments
+                )
+            )
+        rows = self._start_rows()
+        keep = (1 - self.params.self_discharge) ** self.dt
+        value = keep * np.array(start)
+        if not np.array_equal(m.b_eq[rows], value):
+            m.b_eq[rows] = value
+            self._dirty_start = True
+
+    def _update_bounds(self):
+        m, caps, params = self.model, self.caps, self.params
+        soc_lb = np.full(self.T, params.soc_min * caps["energy_cap"])
+        soc_ub = np.full(self.T, params.soc_max * caps["energy_cap"])
+        if params.terminal_soc is not None:
+            soc_lb[-1] = params.terminal_soc * caps["energy_cap"]
+        if self.end_charge is not None:
+            soc_lb[-1] = soc_ub[-1] = self.end_charge
+        block = m.block("soc")
+        if not np.array_equal(m.lb[block], soc_lb):
+            m.lb[block] = soc_lb
+            self._dirty_cols.add("soc")
+        if m.b_ub is not None:
+            b_ub = params.max_daily_cycles * caps["energy_cap"]
+            if not np.all(m.b_ub == b_ub):
+                m.b_ub[:] = b_ub
+                self._dirty_rows = True
+
+        ub = {
+            "solar": np.minimum(self.solar, caps["solar_cap"]),
+            "wind": np.minimum(self.wind, caps["wind_cap"]),
+            "charge": caps["battery_cap"],
+            "discharge": caps["battery_cap"],
+            "grid_export": caps["grid_cap"],
+            "grid_import": caps["grid_cap"],
+            "soc": soc_ub,
+        }
+        if m.segments:
+            ub["segment_charge"] = caps["battery_cap"]
+            ub["segment_discharge"] = caps["battery_cap"]
+            ub["segment_soc"] = caps["energy_cap"] / m.segments
+        for name, value in ub.items():
+            block = m.block(name)
+            if not np.all(m.ub[block] == value):
+                m.ub[block] = value
+                self._dirty_cols.add(name)
+        # The segments' start charge depends on energy_cap
+        self._update_start()
+
+    def _sync(self):
+        # Push the pending changes into the live Highs model
+        m, h = self.model, self._highs
+        for name in self._dirty_cols:
+            block = m.block(name)
+            idx = np.arange(block.start, block.stop, dtype=np.int32)
+            h.changeColsBounds(len(idx), idx, m.lb[block], m.ub[block])
+        if self._dirty_cost:
+            idx = np.arange(m.n_vars, dtype=np.int32)
+            h.changeColsCost(m.n_vars, idx, m.c)
+        if self._dirty_start:
+            for row in self._start_rows():
+                h.changeRowBounds(row, m.b_eq[row], m.b_eq[row])
+        if self._dirty_rows:
+            # The inequality rows follow the equality rows
+            n = len(m.b_ub)
+            idx = np.arange(len(m.b_eq), len(m.b_eq) + n, dtype=np.int32)
+            h.changeRowsBounds(n, idx, np.full(n, -np.inf), m.b_ub)
+
+    def solve(self):
+        if not self.warm:
+            return self.backend.solve(self.model)
+
+        start = time.time()
+        if self._highs is None:
+            self._highs = self.backend.load(self.model)
+        else:
+            self._sync()
+        self._dirty_cols = set()
+        self._dirty_cost = self._dirty_start = self._dirty_rows = False
+        return self.backend.run(self._highs, self.model.A_eq.shape[0], start)
+
+    def solve_model(
+        self,
+        df: pd.DataFrame,
+        solar_cap: int,
+        wind_cap: int,
+        battery_cap: int,
+        energy_cap: int,
+        grid_cap: int,
+        start_charge: int,
+        hooks=(),
+        return_stats=False,
+        params=None,
+    ):
+        # Drop-in for LP.solve_model on a frame of T rows of dt hours
+        if df.shape[0] != self.T:
+            raise ValueError(f"Expected {self.T} rows, got {df.shape[0]}")
+        if time_step(df) != self.dt:
+            raise ValueError(
+                f"Expected steps of {self.dt} h, got {time_step(df)} h"
+            )
+        if params is not None and params != self.params:
+            self.set_params(params)
+
+        start = time.time()
+        stats = SolveStats(hooks)
+        with stats.phase("data_prep"):
+            self.set_profiles(df["Solar"], df["Wind"])
+            self.set_capacities(
+                solar_cap=solar_cap,
+                wind_cap=wind_cap,
+                battery_cap=battery_cap,
+                energy_cap=energy_cap,
+                grid_cap=grid_cap,
+            )
+            self.set_prices(df["Price"])
+            self.set_start_charge(start_charge)
+
+        warm_start = self.warm and self._highs is not None
+        with stats.phase("solve"):
+            solution = self.solve()
+        stats.count(
+            engine="lp",
+            backend=self.backend.name,
+            warm_start=warm_start,
+            status=solution.status,
+            iterations=solution.iterations,
+        )
+        logger.info("LP Status = %s", solution.status)
+        if solution.x is None:
+            raise RuntimeError(f"LP could not be solved: {solution.status}")
+
+        with stats.phase("extraction"):
+            df = df.copy()
+            revenue = attach_solution(df, self.model, solution)
+        discharge = self.model.unpack(solution.x)["discharge"]
+        gross = self.dt * float(df["Price"] @ (df["EXP"] - df["IMP"]))
+        stats.count(
+            equivalent_cycles=self.params.equivalent_cycles(
+                discharge, energy_cap, self.dt
+            ),
+            gross_revenue=gross,
+            degradation_cost=float(gross - revenue),
+        )
+
+        end = time.time()
+        solve_time = end - start
+        if return_stats:
+            return (df, revenue, solve_time, stats)
+        return (df, revenue, solve_time)
@@ -0,0 +1,193 @@
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+import time
+
+from backends import Solution, get_backend
+from matrix_model import (
+    MatrixModel,
+    attach_solution,
+    build_model,
+    time_step,
+)
+
+
+class Asset:
+    # One site: a battery with optional solar/wind behind its own inverter
+    # (grid_cap, AC MW). profile needs Solar and Wind columns in MW and may
+    # carry its own Price column (e.g. a different node); otherwise the
+    # portfolio price is used. Sites naming the same connection share its
+    # import/export limit on top of their own grid_cap. params is the
+    # battery's BatteryParams.
+    def __init__(
+        self,
+        name,
+        profile: pd.DataFrame,
+        solar_cap=0,
+        wind_cap=0,
+        battery_cap=0,
+        energy_cap=0,
+        grid_cap=0,
+        start_charge=0,
+        params=None,
+        connection=None,
+    ):
+        self.name = name
+        self.profile = profile
+        self.solar_cap = solar_cap
+        self.wind_cap = wind_cap
+        self.battery_cap = battery_cap
+        self.energy_cap = energy_cap
+        self.grid_cap = grid_cap
+        self.start_charge = start_charge
+        self.params = params
+        self.connection = connection
+
+
+def build_portfolio(assets, connections=None, price=None):
+    # The asset models side by side (block diagonal), plus for every shared
+    # connection and step one row capping the summed export and one capping
+    # the summed import, after any rows of the asset models. Returns the
+    # model and each asset's column offset.
+    connections = {} if connections is None else connections
+    T = assets[0].profile.shape[0]
+    dt = time_step(assets[0].profile)
+
+    models, offsets = [], []
+    offset = 0
+    for asset in assets:
+        if asset.profile.shape[0] != T:
+            raise ValueError(f"Asset '{asset.name}' has a different horizon")
+        if time_step(asset.profile) != dt:
+            raise ValueError(f"Asset '{asset.name}' has a different time step")
+        df = asset.profile
+        if "Price" not in df:
+            if price is None:
+                raise ValueError(f"No price for asset '{asset.name}'")
+            df = df.assign(Price=np.asarray(price, dtype=float))
+        models.append(
+            build_model(
+                df,
+                asset.solar_cap,
+                asset.wind_cap,
+                asset.battery_cap,
+                asset.energy_cap,
+                asset.grid_cap,
+                asset.start_charge,
+                params=asset.params,
+            )
+        )
+        offsets.append(offset)
+        offset += models[-1].n_vars
+
+    rows, cols = [], []
+    names = list(connections)
+    for a, (asset, model) in enumerate(zip(assets, models)):
+        if asset.connection is None:
+            continue
+        if asset.connection not in connections:
+            raise ValueError(f"Unknown connection '{asset.connection}'")
+        k = names.index(asset.connection)
+        for j, family in enumerate(("grid_export", "grid_import")):
+            block = model.block(family)
+            rows.append((2 * k + j) * T + np.arange(T))
+            cols.append(offsets[a] + np.arange(block.start, block.stop))
+
+    # The assets' own inequality rows (cycle limits), then the connections
+    ub_blocks, ub_rhs = [], []
+    for model, model_offset in zip(models, offsets):
+        if model.A_ub is not None:
+            own = model.A_ub.tocoo()
+            ub_blocks.append(
+                sp.csr_matrix(
+                    (own.data, (own.row, own.col + model_offset)),
+                    shape=(own.shape[0], offset),
+                )
+            )
+            ub_rhs.append(model.b_ub)
+    if rows:
+        rows, cols = np.concatenate(rows), np.concatenate(cols)
+        ub_blocks.append(
+            sp.csr_matrix(
+                (np.ones(len(rows)), (rows, cols)),
+                shape=(2 * len(names) * T, offset),
+            )
+        )
+        ub_rhs.append(
+            np.repeat([connections[n] for n in names], 2 * T).astype(float)
+        )
+
+    A_ub = b_ub = None
+    if ub_blocks:
+        A_ub = sp.vstack(ub_blocks, format="csr")
+        b_ub = np.concatenate(ub_rhs)
+
+    portfolio = MatrixModel(
+        T,
+        np.concatenate([m.c for m in models]),
+        sp.block_diag([m.A_eq for m in models], format="csr"),
+        np.concatenate([m.b_eq for m in models]),
+        np.concatenate([m.lb for m in models]),
+        np.concatenate([m.ub for m in models]),
+        A_ub,
+        b_ub,
+        dt=dt,
+    )
+    return portfolio, models, offsets
+
+
+def solve_portfolio(assets, connections=None, price=None, backend="highs"):
+    # Jointly dispatch every asset. Returns ({name: frame}, revenue,
+    # solve_time) where each frame is the asset's profile with SOC/IMP/EXP
+    # (and duals) added as in LP.solve_model, and the asset's revenue net
+    # of degradation in its attrs["revenue"].
+    start = time.time()
+    portfolio, models, offsets = build_portfolio(assets, connections, price)
+
+    solution = get_backend(backend).solve(portfolio)
+    if solution.x is None:
+        raise RuntimeError(f"LP could not be solved: {solution.status}")
+
+    frames = {}
+    n_eq = 0
+    for asset, model, offset in zip(assets, models, offsets):
+        part = Solution(
+            solution.x[offset : offset + model.n_vars],
+            None,
+            solution.status,
+            duals=(
+                None
+                if solution.duals is None
+                else solution.duals[n_eq : n_eq + len(model.b_eq)]
+            ),
+        )
+        n_eq += len(model.b_eq)
+        df = asset.profile.copy()
+        if "Price" not in df:
+            df["Price"] = np.asarray(price, dtype=float)
+        df.attrs["revenue"] = attach_solution(df, model, part)
+        frames[asset.name] = df
+
+    end = time.time()
+    solve_time = end - start
+    return (frames, portfolio.revenue(solution.x), solve_time)
+
+
+def summarise(frames):
+    # Revenue (net of degradation, as returned by solve_portfolio, and
+    # gross), energy traded and final SOC per asset
+    rows = []
+    for name, df in frames.items():
+        dt = time_step(df)
+        gross = dt * float(df["Price"] @ (df["EXP"] - df["IMP"]))
+        rows.append(
+            {
+                "asset": name,
+                "revenue": df.attrs.get("revenue", gross),
+                "gross_revenue": gross,
+                "export_MWh": dt * df["EXP"].sum(),
+                "import_MWh": dt * df["IMP"].sum(),
+                "final_SOC": df["SOC"].iloc[-1],
+            }
+        )
+    return pd.DataFrame(rows)
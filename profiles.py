@@ -0,0 +1,183 @@
+# Typed, memory-mapped storage for the hourly profile CSVs
+# (T,Hour,Day,Solar,Wind,Price). A profile is stored as a directory next to
+# the CSV, e.g. 8760_data.profile/, holding one .npy file per column
+# (float32 or int32) and a meta.json. To convert new data from a terminal:
+#   python profiles.py my_profile.csv
+# The CSVs are hourly; a store can also be resampled to another time step
+# (in hours) and is then named after it, e.g. 8760_data_15min.profile/:
+#   python profiles.py my_profile.csv --dt 0.25
+import argparse
+import functools
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+SUFFIX = ".profile"
+
+
+def store_path(csv_path, dt=None):
+    base = os.path.splitext(csv_path)[0]
+    if dt is not None and dt != 1:
+        base += f"_{round(dt * 60)}min"
+    return base + SUFFIX
+
+
+def resample(df: pd.DataFrame, dt: float):
+    # df at a time step of dt hours instead of df.attrs["dt"] (default 1).
+    # A finer step repeats each row, holding its price and power over the
+    # row's interval; a coarser one averages blocks of rows, keeping the
+    # integer columns (Hour, Day) of each block's first row and dropping an
+    # incomplete last block. T numbers the new steps from 1.
+    current = df.attrs.get("dt", 1.0)
+    ratio = current / dt if current >= dt else dt / current
+    k = round(ratio)
+    if k < 1 or not np.isclose(k, ratio):
+        raise ValueError(
+            f"Cannot resample steps of {current} h to {dt} h: one must be "
+            "a whole multiple of the other"
+        )
+
+    if current >= dt:
+        out = df.iloc[np.repeat(np.arange(len(df)), k)]
+        out = out.reset_index(drop=True)
+    else:
+        n = len(df) // k * k
+        columns = {}
+        for col in df.columns:
+            values = df[col].to_numpy()[:n]
+            if values.dtype.kind in "iub":
+                columns[col] = values[::k]
+            else:
+                columns[col] = values.reshape(-1, k).mean(axis=1)
+        out = pd.DataFrame(columns)
+    if "T" in out:
+        out["T"] = np.arange(1, len(out) + 1, dtype=out["T"].dtype)
+    out.attrs["dt"] = dt
+    return out
+
+
+def _source_id(csv_path):
+    stat = os.stat(csv_path)
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+def convert(csv_path, out=None, dt=None):
+    # Write the store for csv_path, resampled to steps of dt hours when
+    # given, and return its path
+    out = store_path(csv_path, dt) if out is None else out
+    df = pd.read_csv(csv_path)
+    if dt is not None:
+        df = resample(df, dt)
+    os.makedirs(out, exist_ok=True)
+
+    dtypes = {}
+    for col in df.columns:
+        if df[col].dtype.kind in "iub":
+            values = df[col].to_numpy(dtype=np.int32)
+        elif df[col].dtype.kind == "f":
+            values = df[col].to_numpy(dtype=np.float32)
+        else:
+            raise ValueError(f"Column '{col}' of {csv_path} is not numeric")
+        np.save(os.path.join(out, f"{col}.npy"), values)
+        dtypes[col] = values.dtype.name
+
+    meta = {
+        "columns": list(df.columns),
+        "dtypes": dtypes,
+        "rows": len(df),
+        "dt": df.attrs.get("dt", 1.0),
+        "source": os.path.basename(csv_path),
+        "source_id": _source_id(csv_path),
+    }
+    # meta.json goes last so a half-written store is never seen as complete
+    with open(os.path.join(out, "meta.json"), "w") as f:
+        json.dump(meta, f, indent=2)
+    return out
+
+
+def _meta(store):
+    try:
+        with open(os.path.join(store, "meta.json")) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _is_fresh(store, csv_path):
+    meta = _meta(store)
+    return meta is not None and meta["source_id"] == _source_id(csv_path)
+
+
+@functools.lru_cache(maxsize=16)
+def _open(store, stamp):
+    # Memory maps of every column, kept open across Streamlit reruns. stamp
+    # (the mtime of meta.json) makes a re-converted store open afresh.
+    meta = _meta(store)
+    return meta, {
+        col: np.load(os.path.join(store, f"{col}.npy"), mmap_mode="r")
+        for col in meta["columns"]
+    }
+
+
+def load_profile(path, start=None, stop=None, columns=None, dt=None):
+    # Rows start:stop of a profile as a DataFrame, with its time step in
+    # hours in df.attrs["dt"]. path is either a store or a CSV, in which
+    # case its store (resampled to dt, when given) is (re)built when missing
+    # or older than the CSV. Only the requested rows are read from disk.
+    store = path
+    if not path.endswith(SUFFIX):
+        store = store_path(path, dt)
+        if not _is_fresh(store, path):
+            try:
+                convert(path, store, dt)
+            except OSError:
+                # Read-only location: parse the CSV as before
+                df = pd.read_csv(path)
+                if dt is not None:
+                    df = resample(df, dt)
+                df = df[start:stop].reset_index(drop=True)
+                return df if columns is None else df[list(columns)]
+
+    stamp = os.stat(os.path.join(store, "meta.json")).st_mtime_ns
+    meta, arrays = _open(store, stamp)
+    if dt is not None and not np.isclose(meta.get("dt", 1.0), dt):
+        raise ValueError(f"{store} has steps of {meta.get('dt', 1.0)} h")
+    columns = meta["columns"] if columns is None else columns
+    df = pd.DataFrame(
+        {col: np.array(arrays[col][start:stop]) for col in columns}
+    )
+    df.attrs["dt"] = meta.get("dt", 1.0)
+    return df
+
+
+def profile_length(path, dt=None):
+    # Number of rows in a profile, read from the store's metadata
+    store = path
+    if not path.endswith(SUFFIX):
+        store = store_path(path, dt)
+        if not _is_fresh(store, path):
+            return len(load_profile(path, columns=("T",), dt=dt))
+    return _meta(store)["rows"]
+
+
+def cli(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Convert profile CSVs to the memory-mapped format"
+    )
+    parser.add_argument("csv", nargs="+")
+    parser.add_argument("--out", help="output directory (one CSV only)")
+    parser.add_argument(
+        "--dt", type=float, help="resample to steps of this many hours"
+    )
+    args = parser.parse_args(argv)
+    if args.out and len(args.csv) > 1:
+        parser.error("--out needs a single CSV")
+
+    for csv_path in args.csv:
+        print(convert(csv_path, args.out, args.dt))
+
+
+if __name__ == "__main__":
+    cli()
@@ -0,0 +1,286 @@
+import os
+import shutil
+import tempfile
+import time
+import weakref
+
+import numpy as np
+import pandas as pd
+
+from battery import BatteryParams
+from stats import SolveStats
+
+# Compact solve results. A DispatchResult holds one float32 array per
+# column (the time index as int32) instead of a float64 frame, and the
+# dashboard's display names are aliases of the same arrays rather than
+# copied columns. solve_multi_year fills one for horizons of many years
+# within a memory budget.
+
+# Display name -> column
+DISPLAY_NAMES = {
+    "Solar (MW)": "Solar",
+    "Wind (MW)": "Wind",
+    "Price ($/MWh)": "Price",
+    "SOC (MWh)": "SOC",
+    "Import (MW)": "IMP",
+    "Export (MW)": "EXP",
+}
+
+# Rough peak memory of building and solving a model, per time step
+BYTES_PER_STEP = 16 * 2**10
+
+
+class DispatchResult:
+    # temporary is a directory holding the columns' files, removed with the
+    # result: by close(), at the end of a with block or once the result is
+    # garbage collected
+    def __init__(
+        self, columns, revenue, solve_time, stats=None, temporary=None
+    ):
+        self.columns = {}
+        for name, values in columns.items():
+            values = np.asarray(values)
+            dtype = np.int32 if values.dtype.kind in "iub" else np.float32
+            values = values.astype(dtype, copy=False).view()
+            values.flags.writeable = False
+            self.columns[name] = values
+        self.revenue = revenue
+        self.solve_time = solve_time
+        self.stats = stats
+        self.temporary = temporary
+        self._cleanup = None
+        if temporary is not None:
+            self._cleanup = weakref.finalize(
+                self, shutil.rmtree, temporary, True
+            )
+
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame, revenue, solve_time, stats=None):
+        # From the frame returned by a solver, e.g.
+        # DispatchResult.from_frame(*solve_model(..., return_stats=True))
+        return cls(
+            {col: df[col].to_numpy() for col in df.columns},
+            revenue,
+            solve_time,
+            stats,
+        )
+
+    def __getitem__(self, name):
+        return self.columns[DISPLAY_NAMES.get(name, name)]
+
+    def __contains__(self, name):
+        return DISPLAY_NAMES.get(name, name) in self.columns
+
+    def __len__(self):
+        return len(next(iter(self.columns.values()), ()))
+
+    def close(self):
+        # Remove the temporary directory now, with the columns mapped from it
+        if self._cleanup is not None:
+            self.columns = {}
+            self._cleanup()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    @property
+    def nbytes(self):
+        return sum(values.nbytes for values in self.columns.values())
+
+    def frame(self, columns=None):
+        # A DataFrame of the given columns (display names allowed) built on
+        # the stored arrays, without copying them
+        columns = list(self.columns) if columns is None else columns
+        return pd.DataFrame({name: self[name] for name in columns}, copy=False)
+
+    def __repr__(self):
+        return (
+            f"DispatchResult({len(self)} steps, {list(self.columns)}, "
+            f"revenue={self.revenue:.2f}, {self.nbytes / 2**20:.1f} MB)"
+        )
+
+
+# Columns of a multi-year result
+MULTI_YEAR_COLUMNS = {
+    "T": np.int32,
+    "Hour": np.int32,
+    "Price": np.float32,
+    "Solar": np.float32,
+    "Wind": np.float32,
+    "SOC": np.float32,
+    "IMP": np.float32,
+    "EXP": np.float32,
+}
+
+
+def _allocate(n, out):
+    # Result arrays, in memory or as .npy files under out
+    if out is None:
+        return {
+            name: np.empty(n, dtype=dtype)
+            for name, dtype in MULTI_YEAR_COLUMNS.items()
+        }
+    os.makedirs(out, exist_ok=True)
+    return {
+        name: np.lib.format.open_memmap(
+            os.path.join(out, f"{name}.npy"), "w+", dtype, (n,)
+        )
+        for name, dtype in MULTI_YEAR_COLUMNS.items()
+    }
+
+
+def solve_multi_year(
+    path,
+    solar_cap: int,
+    wind_cap: int,
+    battery_cap: int,
+    energy_cap: int,
+    grid_cap: int,
+    start_charge: int,
+    start=None,
+    stop=None,
+    commit_hours: float = 24 * 7,
+    lookahead_hours: float = 24,
+    memory_budget_mb: float = 256,
+    out=None,
+    per_mw=True,
+    dt=None,
+    backend=None,
+    params=None,
+    hooks=(),
+):
+    # Rolling solve of rows start:stop of a profile (see profiles.py, and
+    # its dt for sub-hourly steps) of any length. Each window of
+    # commit_hours + lookahead_hours is read from disk on its own and
+    # solved with the same ParametricModel (warm started with highspy); its
+    # first commit_hours are kept and their final SOC carried forward. The
+    # first window reaching stop is solved and kept whole by a model of its
+    # own length, the only one holding the terminal SOC target. The
+    # window is shrunk to fit memory_budget_mb, and the results go to .npy
+    # files under out (when they would not fit in the budget either, a
+    # temporary directory that is removed with the result, see
+    # DispatchResult). Solar and Wind in the profile are per MW installed
+    # unless per_mw is false.
+    from parametric import ParametricModel
+    from profiles import load_profile, profile_length
+
+    start_time = time.time()
+    stats = SolveStats(hooks)
+    params = BatteryParams() if params is None else params
+
+    dt = load_profile(path, 0, 0, dt=dt).attrs["dt"]
+    commit = max(round(commit_hours / dt), 1)
+    lookahead = round(lookahead_hours / dt)
+    n_rows = profile_length(path, dt)
+    start = 0 if start is None else start
+    stop = n_rows if stop is None else min(stop, n_rows)
+    n = stop - start
+    if n <= 0:
+        raise ValueError("No rows to solve")
+
+    # Half of the budget for the model, half for the results
+    budget = memory_budget_mb * 2**20 / 2
+    result_bytes = n * 4 * len(MULTI_YEAR_COLUMNS)
+    window = min(commit + lookahead, int(budget // BYTES_PER_STEP))
+    commit = window - lookahead
+    if commit < 1:
+        raise ValueError(
+            f"A memory budget of {memory_budget_mb} MB cannot fit a window "
+            f"of more than {lookahead_hours} h"
+        )
+    if n <= window:
+        # Short enough to solve in one go
+        window = commit = n
+
+    def new_model(steps, model_params):
+        model = ParametricModel(steps, backend, model_params, dt)
+        model.set_capacities(
+            solar_cap=solar_cap,
+            wind_cap=wind_cap,
+            battery_cap=battery_cap,
+            energy_cap=energy_cap,
+            grid_cap=grid_cap,
+        )
+        return model
+
+    # Windows ending before stop leave the terminal SOC target to the last
+    inner_params = params.replace(terminal_soc=None)
+    temporary = None
+    if out is None and result_bytes > budget:
+        out = temporary = tempfile.mkdtemp(prefix="dispatch-")
+    arrays = _allocate(n, out)
+    soc_range = (params.soc_min * energy_cap, params.soc_max * energy_cap)
+
+    model, charge, revenue, windows, t0 = None, start_charge, 0.0, 0, 0
+    while t0 < n:
+        last = t0 + window >= n
+        if last:
+            model = new_model(n - t0, params)
+        elif model is None:
+            model = new_model(window, inner_params)
+        steps = model.model.T
+        kept = steps if last else commit
+        # Steps of each variable, to keep only the committed part's revenue
+        step_of = np.arange(model.model.n_vars) % steps
+
+        with stats.phase("load"):
+            df = load_profile(
+                path,
+                start + t0,
+                start + t0 + steps,
+                columns=("T", "Hour", "Price", "Solar", "Wind"),
+                dt=dt,
+            )
+            price, solar, wind = (
+                df[col].to_numpy(dtype=float)
+                for col in ("Price", "Solar", "Wind")
+            )
+            if per_mw:
+                solar, wind = solar * solar_cap, wind * wind_cap
+
+        with stats.phase("solve"):
+            model.set_profiles(solar, wind)
+            model.set_prices(price)
+            model.set_start_charge(charge)
+            solution = model.solve()
+        if solution.x is None:
+            raise RuntimeError(
+                f"LP could not be solved for steps {start + t0}-"
+                f"{start + t0 + steps}: {solution.status}"
+            )
+
+        with stats.phase("extraction"):
+            ans = model.model.unpack(solution.x)
+            rows = slice(t0, t0 + kept)
+            arrays["T"][rows] = df["T"][:kept]
+            arrays["Hour"][rows] = df["Hour"][:kept]
+            arrays["Price"][rows] = price[:kept]
+            arrays["Solar"][rows] = solar[:kept]
+            arrays["Wind"][rows] = wind[:kept]
+            arrays["SOC"][rows] = ans["soc"][:kept]
+            arrays["IMP"][rows] = ans["grid_import"][:kept]
+            arrays["EXP"][rows] = ans["grid_export"][:kept]
+            mask = step_of < kept
+            revenue -= float(model.model.c[mask] @ solution.x[mask])
+            charge = min(max(ans["soc"][kept - 1], soc_range[0]), soc_range[1])
+        windows += 1
+        t0 += kept
+
+    for values in arrays.values():
+        if isinstance(values, np.memmap):
+            values.flush()
+    stats.count(
+        steps=n,
+        dt=dt,
+        window=window,
+        commit=commit,
+        windows=windows,
+        warm_start=model.warm,
+        out=out,
+    )
+    return DispatchResult(
+        arrays, revenue, time.time() - start_time, stats, temporary
+    )
@@ -0,0 +1,119 @@
+import numpy as np
+import pandas as pd
+import time
+
+from backends import get_backend
+from battery import BatteryParams
+from matrix_model import build_model, time_step
+from LP import solve_model
+
+
+def solve_rolling(
+    df: pd.DataFrame,
+    solar_cap: int,
+    wind_cap: int,
+    battery_cap: int,
+    energy_cap: int,
+    grid_cap: int,
+    start_charge: int,
+    window_hours: float = 48,
+    commit_hours: float = 24,
+    backend="highs",
+    params=None,
+):
+    # Solve overlapping windows of window_hours, keeping only the first
+    # commit_hours of each and carrying their final SOC into the next one
+    if not 0 < commit_hours <= window_hours:
+        raise ValueError("Need 0 < commit_hours <= window_hours")
+
+    start = time.time()
+    backend = get_backend(backend)
+    params = BatteryParams() if params is None else params
+    # Only the window reaching the end of the horizon keeps the terminal
+    # SOC target
+    inner_params = params.replace(terminal_soc=None)
+    soc_min = params.soc_min * energy_cap
+    soc_max = params.soc_max * energy_cap
+
+    dt = time_step(df)
+    window = max(round(window_hours / dt), 1)
+    commit = min(max(round(commit_hours / dt), 1), window)
+    T = df.shape[0]
+    soc = np.empty(T)
+    grid_import = np.empty(T)
+    grid_export = np.empty(T)
+
+    charge, revenue = start_charge, 0.0
+    for t0 in range(0, T, commit):
+        model = build_model(
+            df.iloc[t0 : t0 + window],
+            solar_cap,
+            wind_cap,
+            battery_cap,
+            energy_cap,
+            grid_cap,
+            charge,
+            params=params if t0 + window >= T else inner_params,
+        )
+        solution = backend.solve(model)
+        if solution.x is None:
+            raise RuntimeError(
+                f"LP could not be solved for steps {t0}-{t0 + window}: "
+                f"{solution.status}"
+            )
+
+        ans = model.unpack(solution.x)
+        kept = slice(t0, min(t0 + commit, T))
+        n = kept.stop - kept.start
+        soc[kept] = ans["soc"][:n]
+        grid_import[kept] = ans["grid_import"][:n]
+        grid_export[kept] = ans["grid_export"][:n]
+        charge = min(max(soc[kept.stop - 1], soc_min), soc_max)
+        # Revenue, net of wear costs, of the committed steps only
+        mask = np.arange(model.n_vars) % model.T < n
+        revenue -= float(model.c[mask] @ solution.x[mask])
+
+    df = df.copy()
+    df["SOC"] = soc
+    df["IMP"] = grid_import
+    df["EXP"] = grid_export
+
+    end = time.time()
+    solve_time = end - start
+    return (df, revenue, solve_time)
+
+
+def rolling_gap(
+    df: pd.DataFrame,
+    solar_cap: int,
+    wind_cap: int,
+    battery_cap: int,
+    energy_cap: int,
+    grid_cap: int,
+    start_charge: int,
+    window_hours: float = 48,
+    commit_hours: float = 24,
+    backend="highs",
+    params=None,
+):
+    # Revenue lost by the rolling horizon relative to the monolithic solve
+    caps = (solar_cap, wind_cap, battery_cap, energy_cap, grid_cap)
+    _, full, full_time = solve_model(
+        df.copy(), *caps, start_charge, backend=backend, params=params
+    )
+    _, rolled, rolled_time = solve_rolling(
+        df.copy(),
+        *caps,
+        start_charge,
+        window_hours,
+        commit_hours,
+        backend,
+        params,
+    )
+    return {
+        "revenue": full,
+        "rolling_revenue": rolled,
+        "gap": (full - rolled) / abs(full) if full else 0.0,
+        "solve_time": full_time,
+        "rolling_solve_time": rolled_time,
+    }
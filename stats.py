@@ -0,0 +1,52 @@
+import logging
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+
+class SolveStats:
+    # Per-phase wall times and counters collected while solving. Each hook is
+    # called as hook(phase, seconds, stats) when a phase finishes, e.g. to
+    # forward timings to a profiler or logger.
+    def __init__(self, hooks=()):
+        self.timings = {}
+        self.counters = {}
+        self.hooks = list(hooks)
+
+    @contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield self
+        finally:
+            elapsed = time.perf_counter() - start
+            self.timings[name] = self.timings.get(name, 0.0) + elapsed
+            for hook in self.hooks:
+                hook(name, elapsed, self)
+
+    def count(self, **counters):
+        self.counters.update(counters)
+
+    @property
+    def total(self):
+        return sum(self.timings.values())
+
+    def to_frame(self):
+        import pandas as pd
+
+        return pd.DataFrame(
+            {
+                "Phase": list(self.timings),
+                "Time (s)": list(self.timings.values()),
+            }
+        )
+
+    def __repr__(self):
+        timings = ", ".join(f"{k}={v:.4f}s" for k, v in self.timings.items())
+        return f"SolveStats({timings}, {self.counters})"
+
+
+def log_phase(phase, seconds, stats):
+    # Hook that logs every phase at DEBUG level
+    logger.debug("%s took %.4f s", phase, seconds)
@@ -0,0 +1,321 @@
+import os
+import time
+
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+
+from backends import get_backend
+from jobs import worker_context
+from matrix_model import MatrixModel, build_model, time_step
+from parametric import ParametricModel
+from profiles import load_profile, resample
+
+# Scenarios are given as a dict of (n_scenarios, T) arrays keyed by profile
+# column ("Price", and optionally "Solar"/"Wind" in MW); columns that are
+# left out are taken from the base frame for every scenario.
+COLUMNS = ("Solar", "Wind", "Price")
+
+# Bootstrapped from when no scenarios or history are given
+DEFAULT_HISTORY = os.path.join(os.path.dirname(__file__), "8760_data.csv")
+
+# Per-worker state for the independent batch, see _init_worker
+_model = None
+_scenarios = None
+
+
+def bootstrap_scenarios(
+    history: pd.DataFrame,
+    n_scenarios: int,
+    T: int,
+    columns=("Price",),
+    seed=None,
+):
+    # Build scenarios of T steps (of history's time step) by stringing
+    # together whole days drawn (with replacement) from history, which keeps
+    # the daily shape and the correlation between columns. Solar and Wind
+    # come out in the units of history, i.e. per MW installed for
+    # 8760_data.csv.
+    rng = np.random.default_rng(seed)
+    day = max(round(24 / time_step(history)), 1)
+    n_days = len(history) // day
+    if n_days == 0:
+        raise ValueError("Need at least one whole day of history")
+    days = rng.integers(0, n_days, size=(n_scenarios, -(-T // day)))
+    steps = (days[:, :, None] * day + np.arange(day)).reshape(n_scenarios, -1)
+    steps = steps[:, :T]
+    return {col: history[col].to_numpy(dtype=float)[steps] for col in columns}
+
+
+def _complete(df, scenarios):
+    n = len(next(iter(scenarios.values())))
+    full = {}
+    for col in COLUMNS:
+        if col in scenarios:
+            full[col] = np.asarray(scenarios[col], dtype=float)
+        else:
+            base = df[col].to_numpy(dtype=float)
+            full[col] = np.broadcast_to(base, (n, len(base)))
+        if full[col].shape != (n, df.shape[0]):
+            raise ValueError(
+                f"{col} scenarios must have shape ({n}, {df.shape[0]})"
+            )
+    return full, n
+
+
+def weighted_percentile(values, weights, q):
+    # np.percentile(values, q) with each value counted by its weight: the
+    # sorted values sit at their cumulative weight (excluding their own),
+    # scaled to [0, 100], and are interpolated between. Equal weights give
+    # np.percentile; values of zero weight are left out.
+    values, weights = values[weights > 0], weights[weights > 0]
+    if np.isnan(values).any():
+        return np.full(np.shape(q), np.nan)
+    order = np.argsort(values)
+    values, weights = values[order], weights[order]
+    if len(values) == 1:
+        return np.full(np.shape(q), values[0])
+    below = np.cumsum(weights) - weights
+    return np.interp(np.asarray(q) / 100, below / below[-1], values)
+
+
+def revenue_stats(revenues, weights):
+    mean = weights @ revenues
+    low, p5, p50, p95, high = weighted_percentile(
+        revenues, weights, [0, 5, 50, 95, 100]
+    )
+    return {
+        "expected_revenue": mean,
+        "std": np.sqrt(weights @ (revenues - mean) ** 2),
+        "min": low,
+        "p5": p5,
+        "p50": p50,
+        "p95": p95,
+        "max": high,
+    }
+
+
+def _init_worker(T, caps, start_charge, scenarios, backend, params, dt):
+    # One ParametricModel per worker: each scenario only changes the prices
+    # and VRE bounds, so it re-solves warm from the previous scenario
+    global _model, _scenarios
+    _model = ParametricModel(T, backend, params, dt)
+    _model.set_capacities(**caps)
+    _model.set_start_charge(start_charge)
+    _scenarios = scenarios
+
+
+def _solve_scenario(i):
+    _model.set_profiles(_scenarios["Solar"][i], _scenarios["Wind"][i])
+    _model.set_prices(_scenarios["Price"][i])
+    solution = _model.solve()
+    revenue = np.nan if solution.x is None else -solution.objective
+    return i, revenue, solution.status
+
+
+def _solve_independent(
+    T, caps, start_charge, scenarios, n, processes, backend, params, dt
+):
+    revenues = np.empty(n)
+    statuses = [None] * n
+    args = (T, caps, start_charge, scenarios, backend, params, dt)
+
+    processes = processes or os.cpu_count()
+    if processes == 1:
+        _init_worker(*args)
+        results = map(_solve_scenario, range(n))
+        for i, revenue, status in results:
+            revenues[i], statuses[i] = revenue, status
+    else:
+        chunksize = max(1, n // (4 * processes))
+        context = worker_context(
+            backends=("highspy", "highs") if backend is None else (backend,)
+        )
+        with context.Pool(processes, _init_worker, args) as pool:
+            for i, revenue, status in pool.imap_unordered(
+                _solve_scenario, range(n), chunksize
+            ):
+                revenues[i], statuses[i] = revenue, status
+    return revenues, statuses
+
+
+def _solve_two_stage(
+    T,
+    caps,
+    start_charge,
+    scenarios,
+    n,
+    weights,
+    commit_hours,
+    backend,
+    params,
+    dt,
+):
+    # One LP over all scenarios: the scenario models share a block-diagonal
+    # copy of the same constraint matrix, the objective is the probability
+    # weighted revenue and the grid import/export of the first commit_hours
+    # (the bids) must be the same in every scenario
+    base = build_model(
+        pd.DataFrame({col: scenarios[col][0] for col in COLUMNS}),
+        caps["solar_cap"],
+        caps["wind_cap"],
+        caps["battery_cap"],
+        caps["energy_cap"],
+        caps["grid_cap"],
+        start_charge,
+        params=params,
+        dt=dt,
+    )
+    nv = base.n_vars
+    price = dt * scenarios["Price"]
+    cost = np.tile(base.c, (n, 1))
+    cost[:, base.block("grid_export")] = -price
+    cost[:, base.block("grid_import")] = price
+    ub = np.tile(base.ub, (n, 1))
+    ub[:, base.block("solar")] = np.minimum(
+        scenarios["Solar"], caps["solar_cap"]
+    )
+    ub[:, base.block("wind")] = np.minimum(scenarios["Wind"], caps["wind_cap"])
+
+    # x_s[j] - x_0[j] == 0 for the committed bid variables j
+    k = min(round(commit_hours / dt), T)
+    committed = np.concatenate(
+        [
+            np.arange(base.block(name).start, base.block(name).start + k)
+            for name in ("grid_export", "grid_import")
+        ]
+    )
+    m = len(committed)
+    rows = np.arange((n - 1) * m)
+    cols = (np.arange(1, n)[:, None] * nv + committed).ravel()
+    link = sp.csr_matrix(
+        (
+            np.concatenate([np.ones(len(rows)), -np.ones(len(rows))]),
+            (
+                np.concatenate([rows, rows]),
+                np.concatenate([cols, np.tile(committed, n - 1)]),
+            ),
+        ),
+        shape=((n - 1) * m, n * nv),
+    )
+
+    A_eq = sp.vstack(
+        [sp.kron(sp.identity(n), base.A_eq, format="csr"), link], format="csr"
+    )
+    b_eq = np.concatenate([np.tile(base.b_eq, n), np.zeros((n - 1) * m)])
+    # Every scenario keeps its own daily cycle limits
+    A_ub = b_ub = None
+    if base.A_ub is not None:
+        A_ub = sp.kron(sp.identity(n), base.A_ub, format="csr")
+        b_ub = np.tile(base.b_ub, n)
+    model = MatrixModel(
+        T,
+        (weights[:, None] * cost).ravel(),
+        A_eq,
+        b_eq,
+        np.tile(base.lb, n),
+        ub.ravel(),
+        A_ub,
+        b_ub,
+    )
+
+    solution = get_backend(backend).solve(model)
+    if solution.x is None:
+        return np.full(n, np.nan), [solution.status] * n, None
+
+    x = solution.x.reshape(n, nv)
+    revenues = -np.einsum("ij,ij->i", cost, x)
+    bids = pd.DataFrame(
+        {
+            "IMP": x[0, base.block("grid_import")][:k],
+            "EXP": x[0, base.block("grid_export")][:k],
+        }
+    )
+    return revenues, [solution.status] * n, bids
+
+
+def solve_scenarios(
+    df: pd.DataFrame,
+    solar_cap: int,
+    wind_cap: int,
+    battery_cap: int,
+    energy_cap: int,
+    grid_cap: int,
+    start_charge: int,
+    scenarios=None,
+    n_scenarios: int = 20,
+    weights=None,
+    mode: str = "independent",
+    commit_hours: int = 24,
+    history=None,
+    seed=None,
+    processes=None,
+    backend=None,
+    params=None,
+):
+    # Optimise against several price (and optionally VRE) scenarios. When no
+    # scenarios are given, n_scenarios price series are bootstrapped from
+    # history (8760_data.csv by default), resampled to the step of df. mode "independent" solves each
+    # scenario on its own (perfect foresight per scenario) across a process
+    # pool; "two_stage" solves one stochastic LP whose first commit_hours
+    # of grid import/export are shared by all scenarios.
+    start = time.time()
+    T = df.shape[0]
+    dt = time_step(df)
+    if scenarios is None:
+        if history is None:
+            history = load_profile(DEFAULT_HISTORY)
+        if not np.isclose(time_step(history), dt):
+            history = resample(history, dt)
+        scenarios = bootstrap_scenarios(history, n_scenarios, T, seed=seed)
+    scenarios, n = _complete(df, scenarios)
+
+    weights = np.full(n, 1 / n) if weights is None else np.asarray(weights)
+    if weights.shape != (n,) or not np.isclose(weights.sum(), 1):
+        raise ValueError("weights must be n_scenarios probabilities")
+
+    caps = {
+        "solar_cap": solar_cap,
+        "wind_cap": wind_cap,
+        "battery_cap": battery_cap,
+        "energy_cap": energy_cap,
+        "grid_cap": grid_cap,
+    }
+    bids = None
+    if mode == "independent":
+        revenues, statuses = _solve_independent(
+            T,
+            caps,
+            start_charge,
+            scenarios,
+            n,
+            processes,
+            backend,
+            params,
+            dt,
+        )
+    elif mode == "two_stage":
+        revenues, statuses, bids = _solve_two_stage(
+            T,
+            caps,
+            start_charge,
+            scenarios,
+            n,
+            weights,
+            commit_hours,
+            backend or "highs",
+            params,
+            dt,
+        )
+    else:
+        raise ValueError(f"Unknown mode '{mode}'")
+
+    return {
+        "mode": mode,
+        **revenue_stats(revenues, weights),
+        "scenarios": pd.DataFrame(
+            {"weight": weights, "revenue": revenues, "status": statuses}
+        ),
+        "bids": bids,
+        "solve_time": time.time() - start,
+    }
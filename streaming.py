@@ -0,0 +1,200 @@
+import asyncio
+import time
+
+import numpy as np
+import pandas as pd
+
+from backends import get_backend
+from battery import BatteryParams
+from parametric import ParametricModel, default_backend
+
+# Receding-horizon dispatch for a live control loop. Each update is a
+# forecast of the next steps, (Price, Solar, Wind) arrays or a frame with
+# those columns. It is solved from the current SOC, and only the first
+# step's decision is emitted and applied. One ParametricModel is kept per
+# forecast length, so with highspy each update warm starts from the basis of
+# the previous one. With a time_limit, an update whose solve runs out of
+# time holds the battery idle instead of waiting.
+
+DECISIONS = ("charge", "discharge", "grid_import", "grid_export", "soc")
+
+
+class Decision:
+    # What to do in one step of dt hours: battery charge/discharge and grid
+    # import/export (MW), and the SOC (MWh) at the end of the step
+    def __init__(
+        self,
+        step,
+        price,
+        charge,
+        discharge,
+        grid_import,
+        grid_export,
+        soc,
+        status,
+        latency,
+        fallback=False,
+        dt=1.0,
+    ):
+        self.step = step
+        self.price = price
+        self.charge = charge
+        self.discharge = discharge
+        self.grid_import = grid_import
+        self.grid_export = grid_export
+        self.soc = soc
+        self.status = status
+        self.latency = latency
+        self.fallback = fallback
+        self.dt = dt
+
+    @property
+    def revenue(self):
+        return self.dt * self.price * (self.grid_export - self.grid_import)
+
+    def as_dict(self):
+        return {**vars(self), "revenue": self.revenue}
+
+    def __repr__(self):
+        return (
+            f"Decision(step={self.step}, charge={self.charge:.3f}, "
+            f"discharge={self.discharge:.3f}, "
+            f"import={self.grid_import:.3f}, export={self.grid_export:.3f}, "
+            f"soc={self.soc:.3f}, {self.status}, {self.latency * 1e3:.1f} ms)"
+        )
+
+
+class StreamingDispatcher:
+    # Forecasts hold one value per step of dt hours; those longer than
+    # lookahead steps are cut to it. time_limit (seconds per solve) applies
+    # when backend is given by name; None uses highspy when installed. A
+    # stream has no known end, so a terminal_soc in params is not applied
+    # to the forecast windows (whose ends are not the end of the horizon).
+    def __init__(
+        self,
+        solar_cap: int,
+        wind_cap: int,
+        battery_cap: int,
+        energy_cap: int,
+        grid_cap: int,
+        start_charge: int,
+        lookahead: int = 24,
+        backend=None,
+        params=None,
+        time_limit=None,
+        dt=1.0,
+    ):
+        options = {} if time_limit is None else {"time_limit": time_limit}
+        self.backend = get_backend(backend or default_backend(), **options)
+        self.params = BatteryParams() if params is None else params
+        self._window_params = self.params.replace(terminal_soc=None)
+        self.caps = {
+            "solar_cap": solar_cap,
+            "wind_cap": wind_cap,
+            "battery_cap": battery_cap,
+            "energy_cap": energy_cap,
+            "grid_cap": grid_cap,
+        }
+        self.lookahead = lookahead
+        self.dt = dt
+        self.soc = start_charge
+        self.step = 0
+        self.revenue = 0.0
+        self._models = {}
+
+    def _model(self, T):
+        # Only the tail of a finite stream is shorter than lookahead
+        model = self._models.get(T)
+        if model is None:
+            model = ParametricModel(
+                T, self.backend, self._window_params, self.dt
+            )
+            model.set_capacities(**self.caps)
+            self._models[T] = model
+        return model
+
+    def _hold(self, price, solar, wind):
+        # Fallback when no solution arrived in time: leave the battery idle
+        # and export the available VRE unless the price is negative
+        vre = min(solar, self.caps["solar_cap"]) + min(
+            wind, self.caps["wind_cap"]
+        )
+        export = 0.0
+        if price >= 0:
+            export = min(self.params.inverter_eff * vre, self.caps["grid_cap"])
+        soc = (1 - self.params.self_discharge) ** self.dt * self.soc
+        return 0.0, 0.0, 0.0, export, soc
+
+    def update(self, price, solar=None, wind=None):
+        # Re-optimise the forecast window from the current SOC and apply
+        # the first step's decision
+        start = time.perf_counter()
+        price = np.asarray(price, dtype=float)[: self.lookahead]
+        T = len(price)
+        if T == 0:
+            raise ValueError("Empty forecast")
+        solar = np.zeros(T) if solar is None else np.asarray(solar, float)
+        wind = np.zeros(T) if wind is None else np.asarray(wind, float)
+        solar, wind = solar[:T], wind[:T]
+        if len(solar) != T or len(wind) != T:
+            raise ValueError(
+                "Price, Solar and Wind forecasts differ in length"
+            )
+
+        model = self._model(T)
+        model.set_profiles(solar, wind)
+        model.set_prices(price)
+        model.set_start_charge(self.soc)
+        solution = model.solve()
+
+        fallback = solution.x is None
+        if fallback:
+            values = self._hold(price[0], solar[0], wind[0])
+        else:
+            ans = model.model.unpack(solution.x)
+            values = [float(ans[name][0]) for name in DECISIONS]
+
+        decision = Decision(
+            self.step,
+            float(price[0]),
+            *values,
+            solution.status,
+            time.perf_counter() - start,
+            fallback,
+            self.dt,
+        )
+        energy_cap = self.caps["energy_cap"]
+        self.soc = min(
+            max(decision.soc, self.params.soc_min * energy_cap),
+            self.params.soc_max * energy_cap,
+        )
+        self.step += 1
+        self.revenue += decision.revenue
+        return decision
+
+    def stream(self, updates):
+        # Yields one Decision per forecast update
+        for update in updates:
+            yield self.update(*_unpack(update))
+
+    async def astream(self, updates):
+        # As stream(), for an async iterator of updates. Solves run in a
+        # worker thread so the event loop keeps serving while they do.
+        loop = asyncio.get_running_loop()
+        async for update in updates:
+            yield await loop.run_in_executor(
+                None, self.update, *_unpack(update)
+            )
+
+
+def _unpack(update):
+    if isinstance(update, pd.DataFrame):
+        return update["Price"], update["Solar"], update["Wind"]
+    return update
+
+
+def forecast_windows(df: pd.DataFrame, lookahead: int = 24):
+    # Perfect-foresight updates from a profile, for replaying history
+    # through a StreamingDispatcher
+    for t in range(df.shape[0]):
+        yield df.iloc[t : t + lookahead]
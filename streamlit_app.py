@@ -1,37 +1,22 @@
 # To launch dashboard, in terminal -> streamlit run streamlit_app.py
-from LP import solve_model
+from charts import line_figure
+from profiles import load_profile
+from results import DispatchResult
 import text as t
 import streamlit as st
-import pandas as pd
-import plotly.express as px
 
 
 def make_line_chart(df_arg, x_arg, y_arg, cols):
     st.plotly_chart(
-        px.line(
-            df_arg,
-            x=x_arg,
-            y=y_arg,
-            line_shape="spline",
-            color_discrete_sequence=cols,
-            width=900,
+        line_figure(
+            df_arg[[x_arg, *y_arg]],
+            x_arg,
+            y_arg,
+            cols,
             height=500,
-            labels={
-                "variable": "Legend",
-                "value": "Value",
-                "Solar": "MW",
-                "Price": "Hour",
-            },
-        )
-        .update_layout(
-            {
-                "title_text": "",
-                "plot_bgcolor": "#0E1116",
-                "paper_bgcolor": "#0E1116",
-            }
+            line_shape="spline",
+            value_label="Value",
         )
-        .update_xaxes(linecolor="#27292E", gridcolor="#27292E")
-        .update_yaxes(linecolor="#27292E", gridcolor="#27292E")
     )
 
 
@@ -39,9 +24,7 @@ def cli():
     st.set_page_config(layout="wide")
 
     # Reading in / manipulating data
-    df = pd.read_csv("24hours.csv")
-    df["Solar (MW)"] = df["Solar"]
-    df["Price ($/MWh)"] = df["Price"]
+    df = load_profile("24hours.csv")
     header = st.container()
 
     with header:
@@ -51,7 +34,12 @@ def cli():
         st.image("diagram.jpg")
         st.markdown(t.intro2)
         make_line_chart(
-            df, "Hour", ["Solar (MW)", "Price ($/MWh)"], ["salmon", "skyblue"]
+            df.rename(
+                columns={"Solar": "Solar (MW)", "Price": "Price ($/MWh)"}
+            ),
+            "Hour",
+            ["Solar (MW)", "Price ($/MWh)"],
+            ["salmon", "skyblue"],
         )
 
         st.markdown(t.intro3)
@@ -90,16 +78,22 @@ def cli():
     results = st.container()
     with results:
         if st.button("Solve Model"):
+            # The solver is only loaded once someone asks for a solve
+            from cache import cached_solve_model
+
             df["Solar"] = df["Solar"]
-            df_ans, tot, solve_time = solve_model(
-                df,
-                solar_cap=50,
-                wind_cap=0,
-                battery_cap=10,
-                energy_cap=50,
-                grid_cap=10,
-                start_charge=0,
+            result = DispatchResult.from_frame(
+                *cached_solve_model(
+                    df,
+                    solar_cap=50,
+                    wind_cap=0,
+                    battery_cap=10,
+                    energy_cap=50,
+                    grid_cap=10,
+                    start_charge=0,
+                )
             )
+            tot, solve_time = result.revenue, result.solve_time
             st.header("The model solved!")
 
             col1, col2 = st.columns(2)
@@ -115,17 +109,13 @@ def cli():
                     delta=f"{round(100*((tot/ 1374) - 1))}% compared to base scenario",
                 )
 
-            df_ans["Solar (MW)"] = df_ans["Solar"]
-            df_ans["Price ($/MWh)"] = df_ans["Price"]
-            df_ans["SOC (MWh)"] = df_ans["SOC"]
-            df_ans["Import (MW)"] = df_ans["IMP"]
-            df_ans["Export (MW)"] = df_ans["EXP"]
-
             st.markdown(
                 "The chart below shows the SOC of the battery relative to the PV output and price variations:"
             )
             make_line_chart(
-                df_ans,
+                result.frame(
+                    ["Hour", "Solar (MW)", "Price ($/MWh)", "SOC (MWh)"]
+                ),
                 "Hour",
                 ["Solar (MW)", "Price ($/MWh)", "SOC (MWh)"],
                 ["salmon", "skyblue", "green"],
@@ -138,7 +128,9 @@ def cli():
                 "Since we went to the trouble of writing a complete model we can also compare $GridImport_t$, $GridExpor_tt$ against the $Price_t$ to see if we can spot any interesting behaviour: "
             )
             make_line_chart(
-                df_ans,
+                result.frame(
+                    ["Hour", "Import (MW)", "Export (MW)", "Price ($/MWh)"]
+                ),
                 "Hour",
                 ["Import (MW)", "Export (MW)", "Price ($/MWh)"],
                 ["red", "blue", "skyblue"],
@@ -0,0 +1,235 @@
+# Parameter sweeps for battery sizing studies. From a terminal:
+#   python sweep.py --battery 5,10,20 --energy 20,40,80 --days 30 --out s.csv
+# Battery physics (battery.BatteryParams fields) can be swept too, e.g.
+#   python sweep.py --param charge_eff=0.9,0.95 --param terminal_soc=0.5
+import argparse
+import csv
+import itertools
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from arbitrage import dispatch, is_storage_only
+from backends import get_backend
+from battery import FIELDS, BatteryParams
+from jobs import worker_context
+from matrix_model import build_model
+
+PARAMETERS = ("solar_cap", "wind_cap", "battery_cap", "energy_cap", "grid_cap")
+
+# Profile arrays of the worker process, set once by _init_worker so tasks
+# only need to carry their scenario
+_profile = None
+_backend = None
+
+
+def scenario_grid(**ranges):
+    # Cartesian product of the given values, e.g. scenario_grid(
+    # battery_cap=[5, 10], energy_cap=[20, 40]) gives four scenarios.
+    # BatteryParams fields may be swept alongside the capacities.
+    unknown = set(ranges) - set(PARAMETERS) - set(FIELDS)
+    if unknown:
+        raise ValueError(f"Unknown sweep parameters {sorted(unknown)}")
+    names = list(ranges)
+    return [
+        dict(zip(names, values))
+        for values in itertools.product(*(ranges[n] for n in names))
+    ]
+
+
+def _init_worker(profile, backend):
+    global _profile, _backend
+    _profile = profile
+    _backend = get_backend(backend)
+
+
+def _solve_scenario(scenario):
+    # Solar and Wind in the profile are per MW of installed capacity, as in
+    # the 8760_data.csv file
+    df = pd.DataFrame(
+        {
+            "Solar": _profile["Solar"] * scenario["solar_cap"],
+            "Wind": _profile["Wind"] * scenario["wind_cap"],
+            "Price": _profile["Price"],
+        }
+    )
+    start = time.time()
+    start_charge = scenario["start_soc"] * scenario["energy_cap"]
+    params = BatteryParams(**{k: scenario[k] for k in FIELDS if k in scenario})
+    if is_storage_only(
+        df, scenario["solar_cap"], scenario["wind_cap"], params
+    ):
+        soc, revenue = dispatch(
+            _profile["Price"],
+            scenario["battery_cap"],
+            scenario["energy_cap"],
+            scenario["grid_cap"],
+            start_charge,
+            params,
+        )
+        fall = np.maximum(-np.diff(soc, prepend=start_charge), 0)
+        return {
+            **scenario,
+            "revenue": revenue,
+            "cycles": params.equivalent_cycles(
+                fall * params.discharge_eff, scenario["energy_cap"]
+            ),
+            "solve_time": time.time() - start,
+            "status": "Optimal",
+        }
+
+    model = build_model(
+        df,
+        scenario["solar_cap"],
+        scenario["wind_cap"],
+        scenario["battery_cap"],
+        scenario["energy_cap"],
+        scenario["grid_cap"],
+        start_charge,
+        params=params,
+    )
+    solution = _backend.solve(model)
+    cycles = None
+    if solution.x is not None:
+        cycles = params.equivalent_cycles(
+            model.unpack(solution.x)["discharge"], scenario["energy_cap"]
+        )
+    return {
+        **scenario,
+        "revenue": None if solution.x is None else -solution.objective,
+        "cycles": cycles,
+        "solve_time": time.time() - start,
+        "status": solution.status,
+    }
+
+
+def run_sweep(
+    profile: pd.DataFrame,
+    scenarios,
+    start_soc: float = 0.5,
+    processes=None,
+    backend="highs",
+):
+    # Yields one result row per scenario as soon as it is solved (so not in
+    # input order). Parameters missing from a scenario default to 0, and
+    # start_charge is start_soc * energy_cap as on the Customise page. The
+    # revenue is net of any degradation cost; cycles counts equivalent full
+    # cycles.
+    shared = {
+        col: profile[col].to_numpy(dtype=float)
+        for col in ("Solar", "Wind", "Price")
+    }
+    tasks = [
+        {
+            **{name: 0 for name in PARAMETERS},
+            "start_soc": start_soc,
+            **scenario,
+        }
+        for scenario in scenarios
+    ]
+
+    processes = processes or os.cpu_count()
+    if processes == 1:
+        _init_worker(shared, backend)
+        for task in tasks:
+            yield _solve_scenario(task)
+        return
+
+    context = worker_context(backends=(backend,))
+    with context.Pool(processes, _init_worker, (shared, backend)) as pool:
+        for row in pool.imap_unordered(_solve_scenario, tasks):
+            yield row
+
+
+def sweep_table(
+    profile: pd.DataFrame,
+    scenarios,
+    start_soc: float = 0.5,
+    processes=None,
+    backend="highs",
+):
+    rows = run_sweep(profile, scenarios, start_soc, processes, backend)
+    return pd.DataFrame(list(rows))
+
+
+def _values(text):
+    return [float(v) for v in text.split(",")]
+
+
+def _param(text):
+    name, _, values = text.partition("=")
+    if name not in FIELDS:
+        raise argparse.ArgumentTypeError(
+            f"Unknown battery parameter '{name}', choose from {list(FIELDS)}"
+        )
+    return name, _values(values)
+
+
+def cli(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Solve the model over a grid of capacities"
+    )
+    parser.add_argument("profile", nargs="?", default="8760_data.csv")
+    parser.add_argument("--solar", type=_values, default=[0])
+    parser.add_argument("--wind", type=_values, default=[0])
+    parser.add_argument("--battery", type=_values, default=[10])
+    parser.add_argument("--energy", type=_values, default=[40])
+    parser.add_argument("--grid", type=_values, default=[10])
+    parser.add_argument(
+        "--param",
+        type=_param,
+        action="append",
+        default=[],
+        help="battery parameter values, e.g. charge_eff=0.9,0.95",
+    )
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--start-soc", type=float, default=0.5)
+    parser.add_argument("--processes", type=int, default=None)
+    parser.add_argument("--backend", default="highs")
+    parser.add_argument("--out", default=None, help="CSV file, or stdout")
+    args = parser.parse_args(argv)
+
+    profile = pd.read_csv(args.profile).head(args.days * 24)
+    scenarios = scenario_grid(
+        solar_cap=args.solar,
+        wind_cap=args.wind,
+        battery_cap=args.battery,
+        energy_cap=args.energy,
+        grid_cap=args.grid,
+        **dict(args.param),
+    )
+
+    out = open(args.out, "w", newline="") if args.out else sys.stdout
+    try:
+        writer = csv.DictWriter(
+            out,
+            [
+                *PARAMETERS,
+                *(name for name, _ in args.param),
+                "start_soc",
+                "revenue",
+                "cycles",
+                "solve_time",
+                "status",
+            ],
+        )
+        writer.writeheader()
+        for row in run_sweep(
+            profile,
+            scenarios,
+            args.start_soc,
+            args.processes,
+            args.backend,
+        ):
+            writer.writerow(row)
+            out.flush()
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+
+if __name__ == "__main__":
+    cli()